@@ -1,11 +1,71 @@
 import click
+import json
 import sys, os
+from pathlib import Path
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from cambridgeScript.parser.lexer import parse_tokens
 from cambridgeScript.parser.parser import Parser
+from cambridgeScript.parser.cache import DiskCache
 from cambridgeScript.interpreter.variables import VariableState
+from cambridgeScript.interpreter.budget import Budget
 from cambridgeScript.interpreter.interpreter import Interpreter
+from cambridgeScript.interpreter.compiler import Compiler
+from cambridgeScript.interpreter.optimizer import ConstantFolder
+from cambridgeScript.interpreter.profiler import (
+    ProfilingCompiler,
+    ProfilingInterpreter,
+)
+from cambridgeScript.syntax_tree import Program
+from cambridgeScript.vm import BytecodeCompiler, VM
+from cambridgeScript.vm.machine import DEFAULT_MAX_DEPTH
+from cambridgeScript.batch import ENGINES, BatchRunner
+
+
+def _parse(code: str, optimize: bool, cache: bool, cache_dir: str | None) -> Program:
+    if cache:
+        parsed = DiskCache(cache_dir).parse(code)
+    else:
+        tokens = parse_tokens(code)
+        parsed = Parser.parse_program(tokens, code)
+    if optimize:
+        parsed = ConstantFolder.optimize(parsed)
+    return parsed
+
+
+def _budget_options(command):
+    # Limits shared by the commands that run programs
+    command = click.option(
+        "--max-cells",
+        type=click.IntRange(min=0),
+        help="Maximum number of array cells the program may declare.",
+    )(command)
+    command = click.option(
+        "--max-time",
+        type=click.FloatRange(min=0),
+        help="Maximum number of seconds the program may run for.",
+    )(command)
+    command = click.option(
+        "--max-statements",
+        type=click.IntRange(min=0),
+        help="Maximum number of statements (and loop iterations) the program may run.",
+    )(command)
+    return command
+
+
+_max_depth_option = click.option(
+    "--max-depth",
+    type=click.IntRange(min=1),
+    default=DEFAULT_MAX_DEPTH,
+    show_default=True,
+    help="Maximum depth of subroutine calls.",
+)
+
+_virtual_files_option = click.option(
+    "--virtual-files",
+    is_flag=True,
+    help="Keep the files the program writes in memory instead of on disk.",
+)
 
 
 @click.group(invoke_without_command=True)
@@ -19,17 +79,189 @@ def cli(ctx: click.Context):
 
 @cli.command()
 @click.argument("file", type=click.File())
-def run(file):
+@click.option(
+    "--engine",
+    type=click.Choice(ENGINES),
+    default="tree",
+    help="Walk the syntax tree, compile it to closures, or compile it to bytecode.",
+)
+@click.option(
+    "--optimize/--no-optimize",
+    default=True,
+    help="Fold constant expressions before running.",
+)
+@click.option(
+    "--cache/--no-cache",
+    default=True,
+    help="Reuse the parsed program from the on-disk cache.",
+)
+@click.option(
+    "--cache-dir",
+    type=click.Path(file_okay=False),
+    envvar="CAMBRIDGESCRIPT_CACHE_DIR",
+    help="Directory of the parse cache (default: ~/.cache/cambridgeScript).",
+)
+@_max_depth_option
+@_virtual_files_option
+@_budget_options
+def run(
+    file,
+    engine,
+    optimize,
+    cache,
+    cache_dir,
+    max_depth,
+    virtual_files,
+    max_statements,
+    max_time,
+    max_cells,
+):
     # Read source code
     code = file.read()
-
-    # Parse code
-    tokens = parse_tokens(code)
-    parsed = Parser.parse_program(tokens, code)
+    parsed = _parse(code, optimize, cache, cache_dir)
 
     # Create interpreter with simple input stream
-    interpreter = Interpreter(VariableState(), code, sys.stdin, sys.stdout)
-    interpreter.visit(parsed)
+    interpreter = Interpreter(
+        VariableState(),
+        code,
+        sys.stdin,
+        sys.stdout,
+        {} if virtual_files else None,
+        Budget(max_statements, max_time, max_cells),
+        max_depth,
+    )
+    if engine == "closure":
+        Compiler(interpreter).compile(parsed)()
+    elif engine == "vm":
+        VM(interpreter, max_depth).run(BytecodeCompiler.compile_program(parsed, code))
+    else:
+        interpreter.visit(parsed)
+
+
+@cli.command()
+@click.argument("file", type=click.File())
+@click.option(
+    "--engine",
+    type=click.Choice(["tree", "closure"]),
+    default="tree",
+    help="Walk the syntax tree or compile it to closures.",
+)
+@click.option("--optimize/--no-optimize", default=True)
+@click.option("--cache/--no-cache", default=True)
+@click.option(
+    "--cache-dir",
+    type=click.Path(file_okay=False),
+    envvar="CAMBRIDGESCRIPT_CACHE_DIR",
+)
+@click.option(
+    "--limit", type=click.IntRange(min=1), default=20, help="Number of lines to show."
+)
+@click.option(
+    "--collapsed",
+    type=click.File("w"),
+    default="profile.folded",
+    show_default=True,
+    help="File to write collapsed stacks to, for flame graph tools.",
+)
+@_max_depth_option
+@_budget_options
+def profile(
+    file,
+    engine,
+    optimize,
+    cache,
+    cache_dir,
+    limit,
+    collapsed,
+    max_depth,
+    max_statements,
+    max_time,
+    max_cells,
+):
+    """Run FILE, then print its hottest lines and time spent in subroutines."""
+    code = file.read()
+    parsed = _parse(code, optimize, cache, cache_dir)
+    budget = Budget(max_statements, max_time, max_cells)
+
+    if engine == "closure":
+        interpreter = Interpreter(
+            VariableState(), code, sys.stdin, sys.stdout, None, budget, max_depth
+        )
+        compiler = ProfilingCompiler(interpreter)
+        result = compiler.profile
+        run_program = compiler.compile(parsed)
+    else:
+        interpreter = ProfilingInterpreter(
+            VariableState(), code, sys.stdin, sys.stdout, None, budget, max_depth
+        )
+        result = interpreter.profile
+        run_program = lambda: interpreter.visit(parsed)
+    try:
+        run_program()
+    finally:
+        # Report whatever ran, even if the program failed
+        click.echo(result.report(interpreter.origin, limit), err=True)
+        result.write_collapsed(collapsed)
+
+
+@cli.command("run-batch")
+@click.argument("file", type=click.File())
+@click.argument("inputs", nargs=-1, type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "--expected-suffix",
+    help="Compare each case's output with the file named like its input with this suffix (e.g. .out).",
+)
+@click.option("--engine", type=click.Choice(ENGINES), default="tree")
+@click.option("--optimize/--no-optimize", default=True)
+@click.option("--cache/--no-cache", default=True)
+@click.option(
+    "--cache-dir",
+    type=click.Path(file_okay=False),
+    envvar="CAMBRIDGESCRIPT_CACHE_DIR",
+)
+@_max_depth_option
+@_virtual_files_option
+@_budget_options
+def run_batch(
+    file,
+    inputs,
+    expected_suffix,
+    engine,
+    optimize,
+    cache,
+    cache_dir,
+    max_depth,
+    virtual_files,
+    max_statements,
+    max_time,
+    max_cells,
+):
+    """Run FILE once for every input file, printing one JSON line per case."""
+    runner = BatchRunner(
+        file.read(),
+        engine,
+        optimize,
+        DiskCache(cache_dir) if cache else None,
+        max_depth,
+        {} if virtual_files else None,
+        Budget(max_statements, max_time, max_cells),
+    )
+
+    def cases():
+        for name in inputs:
+            path = Path(name)
+            expected = None
+            if expected_suffix is not None:
+                expected_path = path.with_suffix(expected_suffix)
+                if expected_path.exists():
+                    expected = expected_path.read_text()
+            yield name, path.read_text(), expected
+
+    failed = False
+    for result in runner.run_cases(cases()):
+        click.echo(json.dumps(result.to_dict()))
+        failed = failed or result.passed is False
+    sys.exit(1 if failed else 0)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,160 @@
+__all__ = [
+    "ENGINES",
+    "CaseResult",
+    "BatchRunner",
+]
+
+import io
+import time
+from dataclasses import dataclass, asdict
+from typing import Any, Iterable, Iterator
+
+from cambridgeScript.interpreter.budget import Budget
+from cambridgeScript.interpreter.compiler import Compiler
+from cambridgeScript.interpreter.interpreter import Interpreter
+from cambridgeScript.interpreter.optimizer import ConstantFolder
+from cambridgeScript.interpreter.variables import VariableState
+from cambridgeScript.parser.cache import DiskCache, ParseCache
+from cambridgeScript.parser.lexer import parse_tokens
+from cambridgeScript.parser.parser import Parser
+from cambridgeScript.syntax_tree import Program
+from cambridgeScript.vm import BytecodeCompiler, VM
+from cambridgeScript.vm.machine import DEFAULT_MAX_DEPTH
+
+ENGINES = ("tree", "closure", "vm")
+
+
+def _normalize(output: str) -> list[str]:
+    # Outputs are compared ignoring trailing whitespace and blank lines
+    lines = [line.rstrip() for line in output.splitlines()]
+    while lines and not lines[-1]:
+        lines.pop()
+    return lines
+
+
+@dataclass
+class CaseResult:
+    """Outcome of running a program against one input."""
+
+    name: str
+    stdout: str
+    # "ErrorType: message" if the program raised an error
+    error: str | None
+    # Seconds spent running the program, excluding parsing
+    time: float
+    # Whether stdout matched the expected output, None if there was none
+    passed: bool | None = None
+
+    def to_dict(self) -> dict[str, Any]:
+        return asdict(self)
+
+
+class BatchRunner:
+    """
+    Runs one program against many inputs.
+
+    The program is parsed (and optimized and compiled, depending on the
+    engine) once, then every case runs with a fresh VariableState, its own
+    input stream and its own captured output.
+    """
+
+    code: str
+    engine: str
+    program: Program
+
+    def __init__(
+        self,
+        code: str,
+        engine: str = "tree",
+        optimize: bool = True,
+        cache: DiskCache | ParseCache | None = None,
+        max_depth: int = DEFAULT_MAX_DEPTH,
+        files: dict[str, str] | None = None,
+        budget: Budget | None = None,
+    ):
+        """
+        :param code: source code of the program
+        :param engine: "tree", "closure" or "vm", as for the run command
+        :param optimize: whether to fold constant expressions
+        :param cache: on-disk or in-memory cache to parse through, if any
+        :param max_depth: maximum depth of subroutine calls
+        :param files: file names and contents every case starts with in a
+            virtual filesystem, or None to let programs use the disk
+        :param budget: limits every case runs under, or None for no limits
+        """
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown engine {engine!r}")
+        self.code = code
+        self.engine = engine
+        self.max_depth = max_depth
+        self.files = files
+        self.budget = budget
+        if cache is not None:
+            program = cache.parse(code)
+        else:
+            program = Parser.parse_program(parse_tokens(code), code)
+        self.program = ConstantFolder.optimize(program) if optimize else program
+        # Bytecode doesn't depend on the interpreter, so it's compiled once
+        self._bytecode = (
+            BytecodeCompiler.compile_program(self.program, code)
+            if engine == "vm"
+            else None
+        )
+
+    def run(self, stdin: str) -> tuple[str, str | None, float]:
+        """
+        Runs the program once
+        :param stdin: text to use as the program's input
+        :return: the program's output, the error it raised (if any) and the
+            time it took in seconds
+        """
+        output = io.StringIO()
+        interpreter = Interpreter(
+            VariableState(),
+            self.code,
+            io.StringIO(stdin),
+            output,
+            dict(self.files) if self.files is not None else None,
+            self.budget.copy() if self.budget is not None else None,
+            self.max_depth,
+        )
+        error = None
+        start = time.perf_counter()
+        try:
+            if self.engine == "vm":
+                VM(interpreter, self.max_depth).run(self._bytecode)
+            elif self.engine == "closure":
+                Compiler(interpreter).compile(self.program)()
+            else:
+                interpreter.visit(self.program)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        elapsed = time.perf_counter() - start
+        return output.getvalue(), error, elapsed
+
+    def run_case(
+        self, name: str, stdin: str, expected: str | None = None
+    ) -> CaseResult:
+        """
+        Runs the program against one input
+        :param name: name of the case, used in the result
+        :param stdin: text to use as the program's input
+        :param expected: expected output, if it should be checked
+        :return: the result of the case
+        """
+        stdout, error, elapsed = self.run(stdin)
+        passed = None
+        if expected is not None:
+            passed = error is None and _normalize(stdout) == _normalize(expected)
+        return CaseResult(name, stdout, error, elapsed, passed)
+
+    def run_cases(
+        self, cases: Iterable[tuple[str, str, str | None]]
+    ) -> Iterator[CaseResult]:
+        """
+        Runs the program against several inputs
+        :param cases: (name, stdin, expected output or None) of each case
+        :return: an iterator over the results, in the same order
+        """
+        for name, stdin, expected in cases:
+            yield self.run_case(name, stdin, expected)
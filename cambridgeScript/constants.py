@@ -54,6 +54,8 @@ class Keyword(StrEnum):
     AND = "AND"
     OR = "OR"
     NOT = "NOT"
+    DIV = "DIV"
+    MOD = "MOD"
 
 
 class Symbol(StrEnum):
@@ -76,8 +78,6 @@ class Symbol(StrEnum):
     MUL = "*"
     DIV = "/"
     POW = "^"
-    # DDIV = "DIV"
-    # MOD = "MOD"
 
 
 def _unary_sub(n):
@@ -100,5 +100,6 @@ class Operator:
     MUL = operator.mul
     DIV = operator.truediv
     CONCAT = operator.concat
-    # DDIV = operator.floordiv
-    # MOD = operator.mod
+    DDIV = operator.floordiv
+    MOD = operator.mod
+    POW = operator.pow
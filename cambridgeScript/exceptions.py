@@ -21,6 +21,9 @@ class PseudoError(Exception):
     def parse_traceback(self) -> str:
         if not hasattr(self, "origin") or not hasattr(self, "line"):
             return ""
+        if self.line is None or not 1 <= self.line <= len(self.origin):
+            # e.g. a program parsed from a stream without its source
+            return ""
         if self.line >= 2 and self.line <= len(self.origin) - 1:
             return (
                 f"{self.line-1} {self.origin[self.line-2]}\n{self.line} {self.origin[self.line-1]}\n"
@@ -39,6 +42,13 @@ class PseudoError(Exception):
         return f"{msg}{': ' + chr(10) if trace else ''}{trace}"
 
 
+def _token_text(token: Token) -> str:
+    # Keyword and symbol tokens have a kind instead of a value
+    if token.kind is None:
+        return token.value
+    return str(token.kind)
+
+
 class ParserError(PseudoError):
     """Base exception class for errors from the parser"""
 
@@ -58,7 +68,7 @@ class UnexpectedToken(ParserError):
     def message(self):
         return (
             f"Expected '{self.expected}' at {self.actual.location}, "
-            f"found '{self.actual.value}' instead"
+            f"found '{_token_text(self.actual)}' instead"
         )
 
 
@@ -158,6 +168,13 @@ class PseudoSubroutineError(InterpreterError, RuntimeError):
         return self.prompt
 
 
-class ReturnException(Exception):
-    def __init__(self, value):
-        self.value = value
+class PseudoFileError(InterpreterError, OSError):
+
+    def message(self) -> str:
+        return f"File Error: {self.prompt}"
+
+
+class PseudoBudgetError(InterpreterError, RuntimeError):
+
+    def message(self) -> str:
+        return f"Budget Exceeded: {self.prompt}"
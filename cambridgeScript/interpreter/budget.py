@@ -0,0 +1,124 @@
+__all__ = [
+    "Budget",
+]
+
+import sys
+import time
+
+from cambridgeScript.exceptions import PseudoBudgetError
+
+# Statements run between checks of the time limit
+_CHECK_INTERVAL = 1024
+
+
+class Budget:
+    """
+    Limits on what a program may use while it runs.
+
+    Every block of statements subtracts its length from `remaining` when it
+    starts, and every loop iteration subtracts one more, so the engines only
+    decrement a counter. Once it drops below zero, check counts what was
+    used and raises if a limit was reached. Without a statement limit or a
+    time limit, the counter never runs out. Array cells are counted when an
+    array is declared, before it's allocated.
+    """
+
+    __slots__ = (
+        "max_statements",
+        "max_time",
+        "max_cells",
+        "remaining",
+        "cells",
+        "_statements",
+        "_granted",
+        "_deadline",
+    )
+
+    max_statements: int | None
+    max_time: float | None
+    max_cells: int | None
+    # Statements that can run before the next check
+    remaining: int
+    # Array cells allocated so far
+    cells: int
+
+    def __init__(
+        self,
+        max_statements: int | None = None,
+        max_time: float | None = None,
+        max_cells: int | None = None,
+    ):
+        """
+        :param max_statements: number of statements (and loop iterations)
+            the program may run
+        :param max_time: number of seconds the program may run for
+        :param max_cells: number of array cells the program may allocate
+        """
+        self.max_statements = max_statements
+        self.max_time = max_time
+        self.max_cells = max_cells
+        self.start()
+
+    def copy(self) -> "Budget":
+        """Returns an unused budget with the same limits."""
+        return Budget(self.max_statements, self.max_time, self.max_cells)
+
+    def start(self) -> None:
+        """Resets what has been used, and starts the clock for the time limit."""
+        self.cells = 0
+        self._statements = 0
+        self._deadline = (
+            time.perf_counter() + self.max_time if self.max_time is not None else None
+        )
+        self._grant()
+
+    def _grant(self) -> None:
+        if self.max_time is not None:
+            granted = _CHECK_INTERVAL
+        else:
+            granted = sys.maxsize
+        if self.max_statements is not None:
+            granted = min(granted, self.max_statements - self._statements)
+        self.remaining = self._granted = granted
+
+    @property
+    def statements(self) -> int:
+        """Number of statements (and loop iterations) run so far."""
+        return self._statements + self._granted - self.remaining
+
+    def check(self, origin: list[str], line: int | None) -> None:
+        """
+        Counts the statements run since the last check, raising if a limit
+        was reached
+        :param origin: source code of the program, for errors
+        :param line: line of the statement being run, for errors
+        """
+        self._statements = self.statements
+        if self.max_statements is not None and self._statements > self.max_statements:
+            raise PseudoBudgetError(
+                f"Statement limit ({self.max_statements}) reached", origin, line
+            )
+        if self._deadline is not None and time.perf_counter() > self._deadline:
+            raise PseudoBudgetError(
+                f"Time limit ({self.max_time}s) reached", origin, line
+            )
+        self._grant()
+
+    def allocate(
+        self, ranges: list[tuple[int, int]], origin: list[str], line: int | None
+    ) -> None:
+        """
+        Counts the cells of an array about to be declared, raising if that
+        goes over the limit
+        :param ranges: bounds of each dimension of the array
+        :param origin: source code of the program, for errors
+        :param line: line of the declaration, for errors
+        """
+        size = 1
+        for start, end in ranges:
+            size *= max(end - start + 1, 0)
+        if self.max_cells is not None and self.cells + size > self.max_cells:
+            raise PseudoBudgetError(
+                f"Array cell limit ({self.max_cells}) reached", origin, line
+            )
+        self.cells += size
@@ -0,0 +1,675 @@
+__all__ = [
+    "Compiler",
+]
+
+from typing import Any, Callable
+
+from cambridgeScript.interpreter.input import parse_value
+from cambridgeScript.interpreter.interpreter import Interpreter, Return
+from cambridgeScript.interpreter.resolver import Resolver
+from cambridgeScript.parser.lexer import LiteralToken, Value
+from cambridgeScript.syntax_tree.types import PrimitiveType, ArrayType
+from cambridgeScript.exceptions import (
+    InterpreterError,
+    InvalidNode,
+    PseudoAssignmentError,
+    PseudoIndexError,
+    PseudoSubroutineError,
+    PseudoUndefinedError,
+    PseudoOpError,
+    PseudoInputError,
+)
+from cambridgeScript.syntax_tree import (
+    Expression,
+    Assignable,
+    Identifier,
+    Literal,
+    ArrayIndex,
+    FunctionCall,
+    UnaryOp,
+    BinaryOp,
+    Statement,
+    AssignmentStmt,
+    ProcedureCallStmt,
+    FileCloseStmt,
+    FileWriteStmt,
+    FileReadStmt,
+    FileOpenStmt,
+    ReturnStmt,
+    OutputStmt,
+    InputStmt,
+    ConstantDecl,
+    VariableDecl,
+    WhileStmt,
+    RepeatUntilStmt,
+    ForStmt,
+    CaseStmt,
+    IfStmt,
+    FunctionDecl,
+    ProcedureDecl,
+    Program,
+    first_line,
+)
+from cambridgeScript.syntax_tree.visitors import ExpressionVisitor, StatementVisitor
+
+Thunk = Callable[[], Any]
+
+
+def _noop() -> None:
+    pass
+
+
+class Compiler(ExpressionVisitor, StatementVisitor):
+    """
+    Compiles a syntax tree into nested Python closures.
+
+    Every node becomes a single zero-argument callable, so running a program
+    no longer goes through the visitor dispatch for each node. The closures
+    run against the state of the given interpreter (variables, builtins and
+    streams) and behave exactly like the tree-walking Interpreter: statements
+    return None, or a Return once a RETURN statement has run.
+    """
+
+    interpreter: Interpreter
+
+    def __init__(self, interpreter: Interpreter):
+        self.interpreter = interpreter
+        # Compiled bodies of declared subroutines, keyed by declaration node
+        self._bodies: dict[int, Thunk] = {}
+
+    def compile(self, thing: Expression | Statement) -> Thunk:
+        if isinstance(thing, Expression):
+            return ExpressionVisitor.visit(self, thing)
+        else:
+            return StatementVisitor.visit(self, thing)
+
+    def compile_statements(self, statements: list[Statement]) -> Thunk:
+        compiled = tuple(self.compile(stmt) for stmt in statements)
+        if not compiled:
+            return _noop
+        budget = self.interpreter.budget
+        origin = self.interpreter.origin
+        line = first_line(statements)
+        count = len(compiled)
+        if count == 1:
+            only = compiled[0]
+
+            def statement() -> Return | None:
+                budget.remaining -= 1
+                if budget.remaining < 0:
+                    budget.check(origin, line)
+                return only()
+
+            return statement
+
+        def statements_() -> Return | None:
+            budget.remaining -= count
+            if budget.remaining < 0:
+                budget.check(origin, line)
+            for stmt in compiled:
+                if (status := stmt()) is not None:
+                    return status
+            return None
+
+        return statements_
+
+    def _loop_body(self, statements: list[Statement]) -> Thunk:
+        # Loops count their body's statements along with each iteration, so
+        # the body itself doesn't
+        compiled = tuple(self.compile(stmt) for stmt in statements)
+        if not compiled:
+            return _noop
+        if len(compiled) == 1:
+            return compiled[0]
+
+        def statements_() -> Return | None:
+            for stmt in compiled:
+                if (status := stmt()) is not None:
+                    return status
+            return None
+
+        return statements_
+
+    # Expressions
+
+    def visit_binary_op(self, expr: BinaryOp) -> Thunk:
+        left = self.compile(expr.left)
+        right = self.compile(expr.right)
+        operator = expr.operator
+
+        def binary_op() -> Value:
+            left_value = left()
+            right_value = right()
+            try:
+                return operator(left_value, right_value)
+            except TypeError as e:
+                raise PseudoOpError(expr.left, expr.right, e)
+
+        return binary_op
+
+    def visit_unary_op(self, expr: UnaryOp) -> Thunk:
+        operand = self.compile(expr.operand)
+        operator = expr.operator
+
+        def unary_op() -> Value:
+            return operator(operand())
+
+        return unary_op
+
+    def visit_function_call(self, expr: FunctionCall) -> Thunk:
+        interpreter = self.interpreter
+        state = interpreter.variable_state
+        bodies = self._bodies
+        function_name = expr.function.token.value
+        line = expr.function.token.line
+        params = tuple(self.compile(param) for param in expr.params)
+
+        def function_call() -> Value:
+            if function_name in interpreter.builtins:
+                evaluated_params = [param() for param in params]
+                return interpreter.builtins[function_name](evaluated_params)
+            elif function_name in state.functions:
+                func = state.functions[function_name]
+
+                interpreter.enter_subroutine(
+                    func, [param() for param in params], line
+                )
+
+                try:
+                    status = bodies[id(func)]()
+                finally:
+                    state.pop_scope()
+                if status is None:
+                    raise PseudoSubroutineError(
+                        f"Function {function_name} did not return a value",
+                        interpreter.origin,
+                        line,
+                    )
+                return status.value
+            else:
+                raise PseudoUndefinedError(
+                    f"name {function_name} is not defined", interpreter.origin, line
+                )
+
+        return function_call
+
+    def visit_array_index(self, expr: ArrayIndex) -> Thunk:
+        interpreter = self.interpreter
+        state = interpreter.variable_state
+        globals_ = state.globals
+        name = expr.array.token.value
+        line = expr.array.token.line
+        is_local, slot = self._slot(expr.array)
+        index = tuple(self.compile(indexexp) for indexexp in expr.index)
+
+        def array_index() -> Value:
+            frame = state.frame if is_local else globals_
+            if not isinstance(frame.types[slot], ArrayType):
+                raise PseudoAssignmentError(
+                    f"{name} is not an array.", interpreter.origin, line
+                )
+
+            array = frame.values[slot]
+            indices = [indexexp() for indexexp in index]
+            try:
+                return array.cells[array.offset(indices)]
+            except IndexError:
+                raise PseudoIndexError(
+                    name, indices, array.ranges, interpreter.origin, line
+                )
+
+        return array_index
+
+    def visit_literal(self, expr: Literal) -> Thunk:
+        if not isinstance(expr.token, LiteralToken):
+            raise InvalidNode(expr, expr.token, self.interpreter.origin)
+        value = expr.token.value
+
+        def literal() -> Value:
+            return value
+
+        return literal
+
+    def visit_identifier(self, expr: Identifier) -> Thunk:
+        interpreter = self.interpreter
+        state = interpreter.variable_state
+        globals_ = state.globals
+        name = expr.token.value
+        line = expr.token.line
+        is_local, slot = self._slot(expr)
+
+        def identifier() -> Value:
+            frame = state.frame if is_local else globals_
+            if frame.types[slot] is not None:
+                value = frame.values[slot]
+            elif name in state.constants:
+                value = state.constants[name]
+            else:
+                raise InterpreterError(
+                    f"Name {name} isn't defined", interpreter.origin, line
+                )
+
+            if value is None:
+                raise InterpreterError(
+                    f"Name {name} has no value", interpreter.origin, line
+                )
+            return value
+
+        return identifier
+
+    # Statements
+
+    def visit_proc_decl(self, stmt: ProcedureDecl) -> Thunk:
+        state = self.interpreter.variable_state
+        name = stmt.name.value
+        self._bodies[id(stmt)] = self.compile_statements(stmt.body)
+
+        def proc_decl() -> None:
+            state.procedures[name] = stmt
+
+        return proc_decl
+
+    def visit_func_decl(self, stmt: FunctionDecl) -> Thunk:
+        state = self.interpreter.variable_state
+        name = stmt.name.value
+        self._bodies[id(stmt)] = self.compile_statements(stmt.body)
+
+        def func_decl() -> None:
+            state.functions[name] = stmt
+
+        return func_decl
+
+    def visit_if(self, stmt: IfStmt) -> Thunk:
+        condition = self.compile(stmt.condition)
+        then_branch = self.compile_statements(stmt.then_branch)
+        if stmt.else_branch is None:
+
+            def if_() -> Return | None:
+                if condition():
+                    return then_branch()
+                return None
+
+            return if_
+
+        else_branch = self.compile_statements(stmt.else_branch)
+
+        def if_else() -> Return | None:
+            if condition():
+                return then_branch()
+            return else_branch()
+
+        return if_else
+
+    def visit_case(self, stmt: CaseStmt) -> Thunk:
+        expr = self.compile(stmt.expr)
+        cases = tuple(
+            (self.compile(case), self.compile_statements(body))
+            for case, body in stmt.cases
+        )
+        otherwise = (
+            self.compile_statements(stmt.otherwise)
+            if stmt.otherwise is not None
+            else _noop
+        )
+
+        if all(isinstance(case, Literal) for case, _ in stmt.cases):
+            # Literal arms (e.g. after constant folding) are looked up directly,
+            # the first arm wins if several have the same value
+            table: dict[Value, Thunk] = {}
+            for (case, _), (_, body) in zip(stmt.cases, cases):
+                table.setdefault(case.token.value, body)
+
+            def case_table() -> Return | None:
+                return table.get(expr(), otherwise)()
+
+            return case_table
+
+        def case() -> Return | None:
+            value = expr()
+            for case_value, body in cases:
+                if case_value() == value:
+                    return body()
+            return otherwise()
+
+        return case
+
+    def visit_for_loop(self, stmt: ForStmt) -> Thunk:
+        interpreter = self.interpreter
+        state = interpreter.variable_state
+        globals_ = state.globals
+        is_local, slot = self._slot(stmt.variable)
+        line = stmt.variable.token.line
+        start = self.compile(stmt.start)
+        end = self.compile(stmt.end)
+        step = self.compile(stmt.step) if stmt.step is not None else None
+        body = self._loop_body(stmt.body)
+        cost = len(stmt.body) + 1
+        integer = PrimitiveType.INTEGER
+        budget = interpreter.budget
+
+        def for_loop() -> Return | None:
+            current_value = start()
+            end_value = end()
+            step_value = step() if step is not None else 1
+            frame = state.frame if is_local else globals_
+            while (
+                current_value <= end_value
+                if step_value > 0
+                else current_value >= end_value
+            ):
+                budget.remaining -= cost
+                if budget.remaining < 0:
+                    budget.check(interpreter.origin, line)
+                frame.declare(slot, current_value, integer)
+                if (status := body()) is not None:
+                    return status
+                current_value += step_value
+
+        return for_loop
+
+    def visit_repeat_until(self, stmt: RepeatUntilStmt) -> Thunk:
+        interpreter = self.interpreter
+        body = self._loop_body(stmt.body)
+        cost = len(stmt.body) + 1
+        condition = self.compile(stmt.condition)
+        budget = interpreter.budget
+        line = first_line(stmt)
+
+        def repeat_until() -> Return | None:
+            while True:
+                budget.remaining -= cost
+                if budget.remaining < 0:
+                    budget.check(interpreter.origin, line)
+                if (status := body()) is not None:
+                    return status
+                if condition():
+                    break
+
+        return repeat_until
+
+    def visit_while(self, stmt: WhileStmt) -> Thunk:
+        interpreter = self.interpreter
+        condition = self.compile(stmt.condition)
+        body = self._loop_body(stmt.body)
+        cost = len(stmt.body) + 1
+        budget = interpreter.budget
+        line = first_line(stmt)
+
+        def while_() -> Return | None:
+            while condition():
+                budget.remaining -= cost
+                if budget.remaining < 0:
+                    budget.check(interpreter.origin, line)
+                if (status := body()) is not None:
+                    return status
+
+        return while_
+
+    def visit_variable_decl(self, stmt: VariableDecl) -> Thunk:
+        state = self.interpreter.variable_state
+        globals_ = state.globals
+        is_local, slot = self._slot(stmt)
+        vartype = stmt.vartype
+        if not isinstance(vartype, ArrayType):
+
+            def variable_decl() -> None:
+                frame = state.frame if is_local else globals_
+                frame.declare(slot, None, vartype)
+
+            return variable_decl
+
+        ranges = tuple((self.compile(a), self.compile(b)) for a, b in vartype.ranges)
+        interpreter = self.interpreter
+        line = stmt.name.line
+
+        def array_decl() -> None:
+            bounds = [(a(), b()) for a, b in ranges]
+            interpreter.budget.allocate(bounds, interpreter.origin, line)
+            array = state.create_nd_array(bounds)
+            frame = state.frame if is_local else globals_
+            frame.declare(slot, array, vartype)
+
+        return array_decl
+
+    def visit_constant_decl(self, stmt: ConstantDecl) -> Thunk:
+        state = self.interpreter.variable_state
+        name = stmt.name.value
+        value = stmt.value.value
+
+        def constant_decl() -> None:
+            state.constants[name] = value
+
+        return constant_decl
+
+    def visit_input(self, stmt: InputStmt) -> Thunk:
+        read_line = self.interpreter.input.read_line
+        return self._store_line(stmt.variable, lambda line: read_line())
+
+    def _store_line(
+        self, variable: Assignable, read_line: Callable[[int], str]
+    ) -> Thunk:
+        # Store a line read by INPUT or READFILE into a variable
+        interpreter = self.interpreter
+        state = interpreter.variable_state
+        globals_ = state.globals
+        is_array = isinstance(variable, ArrayIndex)
+        identifier = variable.array if is_array else variable
+        name = identifier.token.value
+        line = identifier.token.line
+        is_local, slot = self._slot(identifier)
+        index = (
+            tuple(self.compile(indexexp) for indexexp in variable.index)
+            if is_array
+            else ()
+        )
+
+        def store_line() -> None:
+            frame = state.frame if is_local else globals_
+            declared_type = frame.types[slot]
+            if declared_type is None:
+                if name in state.constants:
+                    raise PseudoInputError(
+                        f"{name} is a constant, which can't be inputted",
+                        interpreter.origin,
+                        line,
+                    )
+                raise InterpreterError(
+                    f"{name} was not declared", interpreter.origin, line
+                )
+            if is_array and not isinstance(declared_type, ArrayType):
+                raise PseudoAssignmentError(
+                    f"{name} is not an array.", interpreter.origin, line
+                )
+
+            vartype = declared_type.type if is_array else declared_type
+            text = read_line(line)
+            val = parse_value(vartype, text, name, interpreter.origin, line)
+            if is_array:
+                array = frame.values[slot]
+                indices = [indexexp() for indexexp in index]
+                try:
+                    array.cells[array.offset(indices)] = val
+                except IndexError:
+                    raise PseudoIndexError(
+                        name, indices, array.ranges, interpreter.origin, line
+                    )
+            else:
+                frame.values[slot] = val
+
+        return store_line
+
+    def visit_output(self, stmt: OutputStmt) -> Thunk:
+        values = tuple(self.compile(expr) for expr in stmt.values)
+        write_line = self.interpreter.output.write_line
+
+        def output() -> None:
+            write_line("".join([str(value()) for value in values]))
+
+        return output
+
+    def visit_return(self, stmt: ReturnStmt) -> Thunk:
+        value = self.compile(stmt.value)
+
+        def return_() -> Return:
+            return Return(value())
+
+        return return_
+
+    def visit_f_open(self, stmt: FileOpenStmt) -> Thunk:
+        files = self.interpreter.files
+        name = stmt.file.value
+        mode = stmt.mode.kind
+        line = stmt.file.line
+
+        def f_open() -> None:
+            files.open(name, mode, line)
+
+        return f_open
+
+    def visit_f_read(self, stmt: FileReadStmt) -> Thunk:
+        read_line = self.interpreter.files.read_line
+        name = stmt.file.value
+        return self._store_line(stmt.target, lambda line: read_line(name, line))
+
+    def visit_f_write(self, stmt: FileWriteStmt) -> Thunk:
+        write_line = self.interpreter.files.write_line
+        name = stmt.file.value
+        value = self.compile(stmt.value)
+        line = stmt.file.line
+
+        def f_write() -> None:
+            write_line(name, str(value()), line)
+
+        return f_write
+
+    def visit_f_close(self, stmt: FileCloseStmt) -> Thunk:
+        files = self.interpreter.files
+        name = stmt.file.value
+        line = stmt.file.line
+
+        def f_close() -> None:
+            files.close(name, line)
+
+        return f_close
+
+    def visit_proc_call(self, stmt: ProcedureCallStmt) -> Thunk:
+        interpreter = self.interpreter
+        state = interpreter.variable_state
+        bodies = self._bodies
+        procedure_name = stmt.name.value
+        line = stmt.name.line
+        args = tuple(self.compile(arg) for arg in stmt.args or ())
+
+        def proc_call() -> None:
+            if procedure_name not in state.procedures:
+                raise PseudoUndefinedError(
+                    f"Procedure {procedure_name} is not defined",
+                    interpreter.origin,
+                    line,
+                )
+
+            proc = state.procedures[procedure_name]
+
+            interpreter.enter_subroutine(proc, [arg() for arg in args], line)
+
+            try:
+                status = bodies[id(proc)]()
+            finally:
+                state.pop_scope()
+            if status is not None:
+                raise PseudoSubroutineError(
+                    f"Procedure {procedure_name} mustn't has return values",
+                    interpreter.origin,
+                    line,
+                )
+
+        return proc_call
+
+    def visit_assign(self, stmt: AssignmentStmt) -> Thunk:
+        interpreter = self.interpreter
+        state = interpreter.variable_state
+        globals_ = state.globals
+        check_type = interpreter.check_type
+        value = self.compile(stmt.value)
+
+        if isinstance(stmt.target, ArrayIndex):
+            name = stmt.target.array.token.value
+            line = stmt.target.array.token.line
+            is_local, slot = self._slot(stmt.target.array)
+            index = tuple(self.compile(indexexp) for indexexp in stmt.target.index)
+
+            def assign_array() -> None:
+                frame = state.frame if is_local else globals_
+                array_type = frame.types[slot]
+                if not isinstance(array_type, ArrayType):
+                    raise PseudoAssignmentError(
+                        f"{name} is not an array.", interpreter.origin, line
+                    )
+                val = value()
+                if not check_type(val, array_type.type):
+                    raise PseudoAssignmentError(
+                        f"Trying to assign invalid type to array {name}, expected {array_type.type.name}",
+                        interpreter.origin,
+                        line,
+                    )
+                array = frame.values[slot]
+                indices = [indexexp() for indexexp in index]
+                try:
+                    array.cells[array.offset(indices)] = val
+                except IndexError:
+                    raise PseudoIndexError(
+                        name, indices, array.ranges, interpreter.origin, line
+                    )
+
+            return assign_array
+
+        name = stmt.target.token.value
+        line = stmt.target.token.line
+        is_local, slot = self._slot(stmt.target)
+
+        def assign() -> None:
+            frame = state.frame if is_local else globals_
+            vartype = frame.types[slot]
+            if vartype is None:
+                if name in state.constants:
+                    raise PseudoAssignmentError(
+                        f"{name} is a constant, which can't be assigned a value.",
+                        interpreter.origin,
+                        line,
+                    )
+                raise InterpreterError(
+                    f"{name} was not declared", interpreter.origin, line
+                )
+            val = value()
+            if check_type(val, vartype):
+                frame.values[slot] = val
+            else:
+                raise PseudoAssignmentError(
+                    f"Type Error for assigning {name}, expected {vartype.name}",
+                    interpreter.origin,
+                    line,
+                )
+
+        return assign
+
+    def visit_program(self, stmt: Program) -> Thunk:
+        interpreter = self.interpreter
+        interpreter.resolution = Resolver.resolve(stmt)
+        interpreter.variable_state.globals.allocate(
+            interpreter.resolution.globals.size
+        )
+        statements = self.compile_statements(stmt.statements)
+
+        def program() -> Return | None:
+            interpreter.budget.start()
+            try:
+                return statements()
+            finally:
+                interpreter.finish()
+
+        return program
+
+    # Helpers
+
+    def _slot(self, node: Identifier | VariableDecl) -> tuple[bool, int]:
+        return self.interpreter.resolution.slots[id(node)]
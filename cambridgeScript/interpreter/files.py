@@ -0,0 +1,176 @@
+__all__ = [
+    "FileTable",
+]
+
+import io
+import mmap
+import os
+from typing import BinaryIO, TextIO
+
+from cambridgeScript.constants import Keyword
+from cambridgeScript.exceptions import PseudoBuiltinError, PseudoFileError
+
+_WRITE_BUFFER_SIZE = 1 << 16
+
+
+class _Handle:
+    __slots__ = ("mode", "stream", "size")
+
+    mode: Keyword
+    # Binary stream with readline() for READ, text stream for WRITE
+    stream: BinaryIO | TextIO
+    # Number of bytes in a file opened for READ
+    size: int
+
+    def __init__(self, mode: Keyword, stream: BinaryIO | TextIO, size: int = 0):
+        self.mode = mode
+        self.stream = stream
+        self.size = size
+
+
+class FileTable:
+    """
+    Files opened by a program, keyed by file name.
+
+    Files opened for READ are memory-mapped, so READFILE only decodes the
+    line it reads, however large the file is. Files opened for WRITE are
+    written through a buffer. If files is given, it's used as a virtual
+    filesystem instead of the disk: READ takes the contents of a file from
+    it, and a file opened for WRITE is stored into it once it's closed.
+    """
+
+    __slots__ = ("origin", "files", "_handles")
+
+    origin: list[str]
+    files: dict[str, str] | None
+
+    def __init__(self, origin: list[str], files: dict[str, str] | None = None):
+        """
+        :param origin: source code of the program, for errors
+        :param files: file names and contents of a virtual filesystem, or
+            None to use the disk
+        """
+        self.origin = origin
+        self.files = files
+        self._handles: dict[str, _Handle] = {}
+
+    def open(self, name: str, mode: Keyword, line: int) -> None:
+        """
+        Opens a file
+        :param name: name of the file
+        :param mode: Keyword.READ or Keyword.WRITE
+        :param line: line of the OPENFILE statement, for errors
+        """
+        if name in self._handles:
+            raise PseudoFileError(f"{name} is already open", self.origin, line)
+        if mode is Keyword.READ:
+            handle = self._open_read(name, line)
+        elif self.files is not None:
+            handle = _Handle(mode, io.StringIO())
+        else:
+            try:
+                stream = open(
+                    name, "w", encoding="utf-8", buffering=_WRITE_BUFFER_SIZE
+                )
+            except OSError as e:
+                raise PseudoFileError(
+                    f"Can't open {name}: {e.strerror}", self.origin, line
+                )
+            handle = _Handle(mode, stream)
+        self._handles[name] = handle
+
+    def _open_read(self, name: str, line: int) -> _Handle:
+        if self.files is not None:
+            if name not in self.files:
+                raise PseudoFileError(f"{name} doesn't exist", self.origin, line)
+            data = self.files[name].encode("utf-8")
+            return _Handle(Keyword.READ, io.BytesIO(data), len(data))
+        try:
+            file = open(name, "rb")
+        except FileNotFoundError:
+            raise PseudoFileError(f"{name} doesn't exist", self.origin, line)
+        except OSError as e:
+            raise PseudoFileError(
+                f"Can't open {name}: {e.strerror}", self.origin, line
+            )
+        with file:
+            size = os.fstat(file.fileno()).st_size
+            if not size:
+                # Empty files can't be mapped
+                return _Handle(Keyword.READ, io.BytesIO(), 0)
+            # The map stays valid once the file is closed
+            stream = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        return _Handle(Keyword.READ, stream, size)
+
+    def _handle(self, name: str, mode: Keyword, line: int) -> _Handle:
+        handle = self._handles.get(name)
+        if handle is None:
+            raise PseudoFileError(f"{name} isn't open", self.origin, line)
+        if handle.mode is not mode:
+            raise PseudoFileError(
+                f"{name} wasn't opened for {mode.value}", self.origin, line
+            )
+        return handle
+
+    def read_line(self, name: str, line: int) -> str:
+        """
+        Reads the next line of a file opened for READ
+        :param name: name of the file
+        :param line: line of the READFILE statement, for errors
+        :return: the line, without its line ending
+        """
+        handle = self._handle(name, Keyword.READ, line)
+        if handle.stream.tell() >= handle.size:
+            raise PseudoFileError(
+                f"Tried to read past the end of {name}", self.origin, line
+            )
+        return handle.stream.readline().decode("utf-8").rstrip("\r\n")
+
+    def write_line(self, name: str, text: str, line: int) -> None:
+        """
+        Writes a line to a file opened for WRITE
+        :param name: name of the file
+        :param text: line to write, without its line ending
+        :param line: line of the WRITEFILE statement, for errors
+        """
+        handle = self._handle(name, Keyword.WRITE, line)
+        handle.stream.write(text)
+        handle.stream.write("\n")
+
+    def close(self, name: str, line: int) -> None:
+        """
+        Closes a file
+        :param name: name of the file
+        :param line: line of the CLOSEFILE statement, for errors
+        """
+        if name not in self._handles:
+            raise PseudoFileError(f"{name} isn't open", self.origin, line)
+        self._close(name, self._handles.pop(name))
+
+    def close_all(self) -> None:
+        """Closes every file that is still open."""
+        handles = self._handles
+        self._handles = {}
+        for name, handle in handles.items():
+            self._close(name, handle)
+
+    def _close(self, name: str, handle: _Handle) -> None:
+        if self.files is not None and handle.mode is Keyword.WRITE:
+            self.files[name] = handle.stream.getvalue()
+        handle.stream.close()
+
+    def eof(self, params):
+        """The EOF builtin, whether a file opened for READ has been read to the end."""
+        if len(params) != 1:
+            raise PseudoBuiltinError("EOF function requires exactly one parameter.")
+
+        [name] = params
+
+        if not isinstance(name, str):
+            raise PseudoBuiltinError("EOF function requires a string parameter.")
+
+        handle = self._handles.get(name)
+        if handle is None or handle.mode is not Keyword.READ:
+            raise PseudoBuiltinError("EOF function requires a file opened for READ.")
+
+        return handle.stream.tell() >= handle.size
@@ -0,0 +1,108 @@
+__all__ = [
+    "InputReader",
+    "parse_value",
+]
+
+import io
+import os
+import stat
+from typing import Callable, TextIO
+
+from cambridgeScript.syntax_tree.types import PrimitiveType
+
+_INTEGER = PrimitiveType.INTEGER
+_REAL = PrimitiveType.REAL
+_STRING = PrimitiveType.STRING
+
+
+class InputReader:
+    """
+    Serves the lines read by INPUT statements.
+
+    If the stream is a regular file or in memory, the whole stream is read and
+    split into lines the first time a line is needed, so each INPUT is a list
+    index instead of a readline call. Terminals and pipes are read a line at a
+    time, so a program driven interactively through a pipe doesn't wait for
+    the end of its input. Lines are stripped of surrounding whitespace, and
+    reading past the end gives empty lines.
+    """
+
+    __slots__ = ("stream", "bulk", "before_read", "_lines", "_position")
+
+    stream: TextIO
+    bulk: bool
+    before_read: Callable[[], None] | None
+
+    def __init__(
+        self,
+        stream: TextIO,
+        bulk: bool | None = None,
+        before_read: Callable[[], None] | None = None,
+    ):
+        """
+        :param stream: text stream to read from
+        :param bulk: whether to read the whole stream at once, defaults to
+            whether the stream is a regular file or in memory
+        :param before_read: called before each line is read a line at a time,
+            e.g. to flush the output so a prompt shows up before the program
+            waits for the answer
+        """
+        self.stream = stream
+        if bulk is None:
+            bulk = _is_complete(stream)
+        self.bulk = bulk
+        self.before_read = before_read
+        self._lines: list[str] | None = None
+        self._position = 0
+
+    def read_line(self) -> str:
+        """Reads the next line of input."""
+        if not self.bulk:
+            if self.before_read is not None:
+                self.before_read()
+            return self.stream.readline().strip()
+        lines = self._lines
+        if lines is None:
+            lines = self._lines = self.stream.read().split("\n")
+        position = self._position
+        if position >= len(lines):
+            return ""
+        self._position = position + 1
+        return lines[position].strip()
+
+
+def _is_complete(stream: TextIO) -> bool:
+    # Whether all of the stream is available up front, rather than written
+    # while the program runs
+    try:
+        mode = os.fstat(stream.fileno()).st_mode
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        # In-memory streams such as io.StringIO have no file descriptor
+        return True
+    return stat.S_ISREG(mode)
+
+
+def parse_value(
+    vartype: PrimitiveType, text: str, name: str, origin: list[str], line: int
+):
+    """
+    Converts a line of input to a value of a type
+    :param vartype: type of the variable being inputted
+    :param text: line of input
+    :param name: name of the variable, for errors
+    :param origin: source code of the program, for errors
+    :param line: line of the statement, for errors
+    :return: the parsed value
+    """
+    # Fast paths for the usual form of each type, anything they reject
+    # goes through parse_to_type for its conversions and errors
+    try:
+        if vartype is _INTEGER:
+            return int(text)
+        if vartype is _REAL:
+            return float(text)
+        if vartype is _STRING:
+            return text
+    except ValueError:
+        pass
+    return PrimitiveType.parse_to_type(vartype, text, name, origin, line)
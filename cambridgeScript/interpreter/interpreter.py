@@ -1,6 +1,13 @@
-from cambridgeScript.interpreter.variables import VariableState
+from typing import Callable
+
+from cambridgeScript.interpreter.budget import Budget
+from cambridgeScript.interpreter.files import FileTable
+from cambridgeScript.interpreter.input import InputReader, parse_value
+from cambridgeScript.interpreter.output import OutputWriter
+from cambridgeScript.interpreter.variables import Array, Frame, VariableState
+from cambridgeScript.interpreter.resolver import Resolution, Resolver
 from cambridgeScript.parser.lexer import LiteralToken, Value
-from cambridgeScript.syntax_tree.expression import Expression
+from cambridgeScript.syntax_tree.expression import Assignable, Expression
 from cambridgeScript.syntax_tree.types import PrimitiveType, ArrayType
 from cambridgeScript.exceptions import (
     InterpreterError,
@@ -11,7 +18,6 @@ from cambridgeScript.exceptions import (
     PseudoUndefinedError,
     PseudoOpError,
     PseudoInputError,
-    ReturnException,
 )
 
 from cambridgeScript.syntax_tree import (
@@ -42,14 +48,30 @@ from cambridgeScript.syntax_tree import (
     FunctionDecl,
     ProcedureDecl,
     Program,
+    first_line,
 )
 from cambridgeScript.syntax_tree.visitors import ExpressionVisitor, StatementVisitor
 from cambridgeScript.interpreter.builtin_function import create_builtins
 import random
 
 
+class Return:
+    """
+    Status returned by a statement when a RETURN statement has run.
+
+    Statements normally return None, so anything else tells the enclosing
+    statements to stop and hand it up to the subroutine call.
+    """
+
+    __slots__ = ("value",)
+
+    def __init__(self, value: Value):
+        self.value = value
+
+
 class Interpreter(ExpressionVisitor, StatementVisitor):
     variable_state: VariableState
+    resolution: Resolution
 
     def __init__(
         self,
@@ -57,12 +79,34 @@ class Interpreter(ExpressionVisitor, StatementVisitor):
         origin: str,
         input_stream=None,
         output_stream=None,
+        files: dict[str, str] | None = None,
+        budget: Budget | None = None,
+        max_depth: int | None = None,
     ):
+        """
+        :param variable_state: variables of the program
+        :param origin: source code of the program, for errors
+        :param input_stream: stream read by INPUT, defaults to sys.stdin
+        :param output_stream: stream written by OUTPUT, defaults to
+            sys.stdout
+        :param files: file names and contents of a virtual filesystem for
+            the file statements, or None to use the disk
+        :param budget: limits on what the program may use, defaults to none
+        :param max_depth: maximum number of subroutine calls active at once,
+            defaults to no limit other than Python's recursion limit
+        """
         self.variable_state = variable_state
+        self.resolution = Resolution()
         self.origin = origin.splitlines()
         self.builtins = create_builtins()
         self.input_stream = input_stream or __import__("sys").stdin
         self.output_stream = output_stream or __import__("sys").stdout
+        self.output = OutputWriter(self.output_stream)
+        self.input = InputReader(self.input_stream, before_read=self.output.flush)
+        self.files = FileTable(self.origin, files)
+        self.builtins["EOF"] = self.files.eof
+        self.budget = budget if budget is not None else Budget()
+        self.max_depth = max_depth
 
     def visit(self, thing: Expression | Statement):
         if isinstance(thing, Expression):
@@ -70,9 +114,52 @@ class Interpreter(ExpressionVisitor, StatementVisitor):
         else:
             return StatementVisitor.visit(self, thing)
 
-    def visit_statements(self, statements: list[Statement]):
+    def visit_statements(self, statements: list[Statement]) -> Return | None:
+        budget = self.budget
+        budget.remaining -= len(statements)
+        if budget.remaining < 0:
+            budget.check(self.origin, first_line(statements))
+        for stmt in statements:
+            if (status := self.visit(stmt)) is not None:
+                return status
+        return None
+
+    def _loop_body(self, statements: list[Statement]) -> Return | None:
+        # Loops count their body's statements along with each iteration, when
+        # it starts, so the body itself doesn't
         for stmt in statements:
-            self.visit(stmt)
+            if (status := self.visit(stmt)) is not None:
+                return status
+        return None
+
+    def _frame(self, node: Identifier | VariableDecl) -> tuple[Frame, int]:
+        # Find the frame and slot that hold a resolved variable
+        is_local, slot = self.resolution.slots[id(node)]
+        if is_local:
+            return self.variable_state.frame, slot
+        return self.variable_state.globals, slot
+
+    def enter_subroutine(
+        self, decl: ProcedureDecl | FunctionDecl, args: list[Value], line: int
+    ) -> None:
+        """
+        Push a frame for a subroutine, with its parameters bound to args.
+        line is the line of the call, for errors.
+        """
+        max_depth = self.max_depth
+        if max_depth is not None and len(self.variable_state.frame_stack) >= max_depth:
+            raise PseudoSubroutineError(
+                f"Maximum recursion depth ({max_depth}) exceeded", self.origin, line
+            )
+        self.variable_state.push_scope(self.resolution.scopes[id(decl)].size)
+        if decl.params is not None:
+            frame = self.variable_state.frame
+            slots = self.resolution.params[id(decl)]
+            for value, slot, param in zip(args, slots, decl.params):
+                # Parameters are passed BYVAL, so arrays are copied
+                if isinstance(value, Array):
+                    value = value.copy()
+                frame.declare(slot, value, param[1])
 
     def visit_binary_op(self, expr: BinaryOp) -> Value:
         left = self.visit(expr.left)
@@ -95,30 +182,22 @@ class Interpreter(ExpressionVisitor, StatementVisitor):
         elif function_name in self.variable_state.functions:
             func = self.variable_state.functions[function_name]
 
-            # Create new scope for function parameters
-            self.variable_state.push_scope()
-            if func.params is not None:
-                # Bind function parameters to new variable state
-                for param, original_param in zip(func_call.params, func.params):
-                    param_value = self.visit(param)
-                    self.variable_state.variables[original_param[0].value] = (
-                        param_value,
-                        original_param[1],
-                    )
+            # Evaluate arguments in the caller's frame, then enter a new one
+            args = [self.visit(param) for param in func_call.params]
+            self.enter_subroutine(func, args, line)
 
             try:
-                # Execute function body and handle return value via exception
-                self.visit_statements(func.body)
-                # If we reach here, no return statement was encountered
+                status = self.visit_statements(func.body)
+            finally:
+                # Restore the previous scope
+                self.variable_state.pop_scope()
+            if status is None:
                 raise PseudoSubroutineError(
                     f"Function {function_name} did not return a value",
                     self.origin,
                     line,
                 )
-            except ReturnException as ret:
-                # Restore previous scope and return value
-                self.variable_state.pop_scope()
-                return ret.value
+            return status.value
         else:
             raise PseudoUndefinedError(
                 f"name {function_name} is not defined", self.origin, line
@@ -126,22 +205,22 @@ class Interpreter(ExpressionVisitor, StatementVisitor):
 
     def visit_array_index(self, expr: ArrayIndex) -> Value:
         name = expr.array.token.value
-        array_type = self.variable_state.variables[name][1]
+        frame, slot = self._frame(expr.array)
+        array_type = frame.types[slot]
         if not isinstance(array_type, ArrayType):
             raise PseudoAssignmentError(
                 f"{name} is not an array.", self.origin, expr.array.token.line
             )
 
         indices = [self.visit(indexexp) for indexexp in expr.index]
-        ranges = [(self.visit(a), self.visit(b)) for a, b in array_type.ranges]
 
         try:
-            target = self.variable_state.get_array_value(name, indices, ranges)
+            target = frame.get_array_value(slot, indices)
         except IndexError:
             raise PseudoIndexError(
                 name,
                 indices,
-                ranges,
+                frame.values[slot].ranges,
                 self.origin,
                 expr.array.token.line,
             )
@@ -154,15 +233,20 @@ class Interpreter(ExpressionVisitor, StatementVisitor):
 
     def visit_identifier(self, expr: Identifier) -> Value:
         name = expr.token.value
-        if name in self.variable_state.variables:
-            value = self.variable_state.variables[name][0]
+        frame, slot = self._frame(expr)
+        if frame.types[slot] is not None:
+            value = frame.values[slot]
         elif name in self.variable_state.constants:
             value = self.variable_state.constants[name]
         else:
-            raise InterpreterError(f"Name {name} isn't defined")
+            raise InterpreterError(
+                f"Name {name} isn't defined", self.origin, expr.token.line
+            )
 
         if value is None:
-            raise InterpreterError(f"Name {name} has no value")
+            raise InterpreterError(
+                f"Name {name} has no value", self.origin, expr.token.line
+            )
         return value
 
     def visit_proc_decl(self, stmt: ProcedureDecl) -> None:
@@ -171,140 +255,152 @@ class Interpreter(ExpressionVisitor, StatementVisitor):
     def visit_func_decl(self, stmt: FunctionDecl) -> None:
         self.variable_state.functions[stmt.name.value] = stmt
 
-    def visit_if(self, stmt: IfStmt) -> None:
+    def visit_if(self, stmt: IfStmt) -> Return | None:
         condition = self.visit(stmt.condition)
         if condition:
-            self.visit_statements(stmt.then_branch)
+            return self.visit_statements(stmt.then_branch)
         elif stmt.else_branch is not None:
-            self.visit_statements(stmt.else_branch)
+            return self.visit_statements(stmt.else_branch)
 
-    def visit_case(self, stmt: CaseStmt):
+    def visit_case(self, stmt: CaseStmt) -> Return | None:
         expr = self.visit(stmt.expr)
         for i in stmt.cases:
             if self.visit(i[0]) == expr:
-                self.visit_statements(i[1])
-                return
+                return self.visit_statements(i[1])
         if stmt.otherwise is not None:
-            self.visit_statements(stmt.otherwise)
+            return self.visit_statements(stmt.otherwise)
 
-    def visit_for_loop(self, stmt: ForStmt) -> None:
+    def visit_for_loop(self, stmt: ForStmt) -> Return | None:
         if isinstance(stmt, ArrayIndex):
             raise NotImplemented
-        name = stmt.variable.token.value
+        frame, slot = self._frame(stmt.variable)
         current_value = self.visit(stmt.start)
         end_value = self.visit(stmt.end)
         if stmt.step is not None:
             step_value = self.visit(stmt.step)
         else:
             step_value = 1
-        cnt = 0
+        budget = self.budget
+        cost = len(stmt.body) + 1
         while (
             current_value <= end_value if step_value > 0 else current_value >= end_value
         ):
-            self.variable_state.variables[name] = (current_value, PrimitiveType.INTEGER)
-            self.visit_statements(stmt.body)
+            budget.remaining -= cost
+            if budget.remaining < 0:
+                budget.check(self.origin, first_line(stmt))
+            frame.declare(slot, current_value, PrimitiveType.INTEGER)
+            if (status := self._loop_body(stmt.body)) is not None:
+                return status
             current_value += step_value
-            cnt += 1
-            if cnt > 10000:
-                raise InterpreterError(
-                    "Maximum iteration limit(10000) reached",
-                    self.origin,
-                    stmt.variable.token.line,
-                )
 
-    def visit_repeat_until(self, stmt: RepeatUntilStmt) -> None:
-        self.visit_statements(stmt.body)
-        cnt = 0
+    def visit_repeat_until(self, stmt: RepeatUntilStmt) -> Return | None:
+        budget = self.budget
+        cost = len(stmt.body) + 1
         while True:
-            self.visit_statements(stmt.body)
+            budget.remaining -= cost
+            if budget.remaining < 0:
+                budget.check(self.origin, first_line(stmt))
+            if (status := self._loop_body(stmt.body)) is not None:
+                return status
             expr = self.visit(stmt.condition)
             if expr:
                 break
-            cnt += 1
-            if cnt > 10000:
-                raise InterpreterError(
-                    "Maximum iteration limit(10000) reached",
-                    self.origin,
-                )
 
-    def visit_while(self, stmt: WhileStmt) -> None:
-        cnt = 0
+    def visit_while(self, stmt: WhileStmt) -> Return | None:
+        budget = self.budget
+        cost = len(stmt.body) + 1
         while self.visit(stmt.condition):
-            self.visit_statements(stmt.body)
-            cnt += 1
-            if cnt > 10000:
-                raise InterpreterError(
-                    "Maximum iteration limit(10000) reached",
-                    self.origin,
-                    stmt.condition.token.line,
-                )
+            budget.remaining -= cost
+            if budget.remaining < 0:
+                budget.check(self.origin, first_line(stmt))
+            if (status := self._loop_body(stmt.body)) is not None:
+                return status
 
     def visit_variable_decl(self, stmt: VariableDecl) -> None:
-        # for name in stmt.names:
-        name = stmt.name
+        frame, slot = self._frame(stmt)
         if isinstance(stmt.vartype, ArrayType):
+            # Bounds are only evaluated here, accesses use the Array's copy
             ranges = [(self.visit(a), self.visit(b)) for a, b in stmt.vartype.ranges]
-            self.variable_state.variables[name.value] = (
-                self.variable_state.create_nd_array(ranges),
-                stmt.vartype,
+            self.budget.allocate(ranges, self.origin, stmt.name.line)
+            frame.declare(
+                slot, self.variable_state.create_nd_array(ranges), stmt.vartype
             )
         else:
-            self.variable_state.variables[name.value] = (None, stmt.vartype)
+            frame.declare(slot, None, stmt.vartype)
 
     def visit_constant_decl(self, stmt: ConstantDecl) -> None:
         self.variable_state.constants[stmt.name.value] = stmt.value.value
 
     def visit_input(self, stmt: InputStmt) -> None:
-        if isinstance(stmt.variable, ArrayIndex):
-            name = stmt.variable.array.token.value
-            array_type = self.variable_state.variables[name][1]
-            vartype = array_type.type
+        self._store_line(stmt.variable, lambda line: self.input.read_line())
+
+    def _store_line(
+        self, variable: Assignable, read_line: Callable[[int], str]
+    ) -> None:
+        # Store a line read by INPUT or READFILE into a variable
+        if isinstance(variable, ArrayIndex):
+            identifier = variable.array
+        else:
+            identifier = variable
+        name = identifier.token.value
+        line = identifier.token.line
+        frame, slot = self._frame(identifier)
+        declared_type = frame.types[slot]
 
+        if declared_type is None:
+            if name in self.variable_state.constants:
+                raise PseudoInputError(
+                    f"{name} is a constant, which can't be inputted",
+                    self.origin,
+                    line,
+                )
+            raise InterpreterError(f"{name} was not declared", self.origin, line)
+
+        if isinstance(variable, ArrayIndex):
+            if not isinstance(declared_type, ArrayType):
+                raise PseudoAssignmentError(
+                    f"{name} is not an array.", self.origin, line
+                )
+            vartype = declared_type.type
         else:
-            name = stmt.variable.token.value
-            vartype = self.variable_state.variables[name][1]
-
-        if name not in self.variable_state.variables:
-            raise InterpreterError(f"{name} was not declared")
-        if name in self.variable_state.constants:
-            raise PseudoInputError(
-                f"{name} is a constant, which can't be inputted",
-                self.origin,
-                stmt.variable.token.line,
-            )
+            vartype = declared_type
 
-        inp = self.input_stream.readline().strip()
-        val = PrimitiveType.parse_to_type(
-            vartype, inp, name, self.origin, stmt.variable.token.line
-        )
-        if isinstance(stmt.variable, ArrayIndex):
-            indices = [self.visit(indexexp) for indexexp in stmt.variable.index]
-            ranges = [(self.visit(a), self.visit(b)) for a, b in vartype.ranges]
-            self.variable_state.set_array_value(name, indices, val, ranges)
+        val = parse_value(vartype, read_line(line), name, self.origin, line)
+        if isinstance(variable, ArrayIndex):
+            indices = [self.visit(indexexp) for indexexp in variable.index]
+            try:
+                frame.set_array_value(slot, indices, val)
+            except IndexError:
+                raise PseudoIndexError(
+                    name,
+                    indices,
+                    frame.values[slot].ranges,
+                    self.origin,
+                    line,
+                )
         else:
-            self.variable_state.variables[name] = (
-                val,
-                self.variable_state.variables[name][1],
-            )
+            frame.values[slot] = val
 
     def visit_output(self, stmt: OutputStmt) -> None:
         values = [self.visit(expr) for expr in stmt.values]
-        print("".join(map(str, values)))
+        self.output.write_line("".join(map(str, values)))
 
-    def visit_return(self, stmt: ReturnStmt) -> None:
-        raise ReturnException(self.visit(stmt.value))
+    def visit_return(self, stmt: ReturnStmt) -> Return:
+        return Return(self.visit(stmt.value))
 
     def visit_f_open(self, stmt: FileOpenStmt) -> None:
-        pass
+        self.files.open(stmt.file.value, stmt.mode.kind, stmt.file.line)
 
     def visit_f_read(self, stmt: FileReadStmt) -> None:
-        pass
+        name = stmt.file.value
+        self._store_line(stmt.target, lambda line: self.files.read_line(name, line))
 
     def visit_f_write(self, stmt: FileWriteStmt) -> None:
-        pass
+        value = self.visit(stmt.value)
+        self.files.write_line(stmt.file.value, str(value), stmt.file.line)
 
     def visit_f_close(self, stmt: FileCloseStmt) -> None:
-        pass
+        self.files.close(stmt.file.value, stmt.file.line)
 
     def visit_proc_call(self, stmt: ProcedureCallStmt) -> None:
         procedure_name = stmt.name.value
@@ -318,34 +414,34 @@ class Interpreter(ExpressionVisitor, StatementVisitor):
         # Retrieve the procedure statement
         proc = self.variable_state.procedures[procedure_name]
 
-        # Create new scope for procedure parameters
-        self.variable_state.push_scope()
-        if proc.params is not None:
-            # Bind parameters passed to the procedure to the new scope
-            for param, proc_param in zip(stmt.args, proc.params):
-                param_value = self.visit(param)
-                self.variable_state.variables[proc_param[0].value] = (
-                    param_value,
-                    proc_param[1],
-                )
+        # Evaluate arguments in the caller's frame, then enter a new one
+        args = [self.visit(param) for param in stmt.args or []]
+        self.enter_subroutine(proc, args, line)
 
         try:
             # Execute the procedure's statements
-            self.visit_statements(proc.body)
-        except ReturnException:
+            status = self.visit_statements(proc.body)
+        finally:
+            # Restore the previous scope
+            self.variable_state.pop_scope()
+        if status is not None:
             raise PseudoSubroutineError(
                 f"Procedure {procedure_name} mustn't has return values",
                 self.origin,
                 line,
             )
-        finally:
-            # Restore the previous scope
-            self.variable_state.pop_scope()
 
     def visit_assign(self, stmt: AssignmentStmt) -> None:
         if isinstance(stmt.target, ArrayIndex):
             name = stmt.target.array.token.value
-            array_type = self.variable_state.variables[name][1]
+            frame, slot = self._frame(stmt.target.array)
+            array_type = frame.types[slot]
+            if not isinstance(array_type, ArrayType):
+                raise PseudoAssignmentError(
+                    f"{name} is not an array.",
+                    self.origin,
+                    stmt.target.array.token.line,
+                )
             val = self.visit(stmt.value)
             if not self.check_type(val, array_type.type):
                 raise PseudoAssignmentError(
@@ -354,42 +450,56 @@ class Interpreter(ExpressionVisitor, StatementVisitor):
                     stmt.target.array.token.line,
                 )
             indices = [self.visit(indexexp) for indexexp in stmt.target.index]
-            ranges = [(self.visit(a), self.visit(b)) for a, b in array_type.ranges]
             try:
-                self.variable_state.set_array_value(name, indices, val, ranges)
+                frame.set_array_value(slot, indices, val)
             except IndexError:
                 raise PseudoIndexError(
                     name,
                     indices,
-                    ranges,
+                    frame.values[slot].ranges,
                     self.origin,
                     stmt.target.array.token.line,
                 )
         else:
             name = stmt.target.token.value
-            if name not in self.variable_state.variables:
-                raise InterpreterError(f"{name} was not declared")
-            if name in self.variable_state.constants:
-                raise PseudoAssignmentError(
-                    f"{name} is a constant, which can't be assigned a value.",
+            frame, slot = self._frame(stmt.target)
+            vartype = frame.types[slot]
+            if vartype is None:
+                if name in self.variable_state.constants:
+                    raise PseudoAssignmentError(
+                        f"{name} is a constant, which can't be assigned a value.",
+                        self.origin,
+                        stmt.target.token.line,
+                    )
+                raise InterpreterError(
+                    f"{name} was not declared",
                     self.origin,
                     stmt.target.token.line,
                 )
             val = self.visit(stmt.value)
-            if self.check_type(val, self.variable_state.variables[name][1]):
-                self.variable_state.variables[name] = (
-                    val,
-                    self.variable_state.variables[name][1],
-                )
+            if self.check_type(val, vartype):
+                frame.values[slot] = val
             else:
                 raise PseudoAssignmentError(
-                    f"Type Error for assigning {name}, expected {self.variable_state.variables[name][1].name}",
+                    f"Type Error for assigning {name}, expected {vartype.name}",
                     self.origin,
                     stmt.target.token.line,
                 )
 
     def visit_program(self, stmt: Program) -> None:
-        self.visit_statements(stmt.statements)
+        self.resolution = Resolver.resolve(stmt)
+        self.variable_state.globals.allocate(self.resolution.globals.size)
+        self.budget.start()
+        try:
+            # A RETURN outside of a function ends the program
+            self.visit_statements(stmt.statements)
+        finally:
+            self.finish()
+
+    def finish(self) -> None:
+        """Flushes the output and closes the files a program left open."""
+        self.output.flush()
+        self.files.close_all()
 
     def check_type(self, val, typ):
         if typ == PrimitiveType.INTEGER:
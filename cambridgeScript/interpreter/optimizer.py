@@ -0,0 +1,287 @@
+__all__ = [
+    "ConstantFolder",
+]
+
+from typing import Iterator
+
+from cambridgeScript.parser.lexer import LiteralToken, Value
+from cambridgeScript.syntax_tree import (
+    Expression,
+    Identifier,
+    Literal,
+    ArrayIndex,
+    FunctionCall,
+    UnaryOp,
+    BinaryOp,
+    Statement,
+    AssignmentStmt,
+    ProcedureCallStmt,
+    FileCloseStmt,
+    FileWriteStmt,
+    FileReadStmt,
+    FileOpenStmt,
+    ReturnStmt,
+    OutputStmt,
+    InputStmt,
+    ConstantDecl,
+    VariableDecl,
+    WhileStmt,
+    RepeatUntilStmt,
+    ForStmt,
+    CaseStmt,
+    IfStmt,
+    FunctionDecl,
+    ProcedureDecl,
+    Program,
+)
+from cambridgeScript.syntax_tree.types import ArrayType, Type
+from cambridgeScript.syntax_tree.visitors import ExpressionVisitor, StatementVisitor
+
+
+def _walk(statements: list[Statement]) -> Iterator[Statement]:
+    # Yields every statement, including those nested in other statements
+    for stmt in statements:
+        yield stmt
+        match stmt:
+            case ProcedureDecl(body=body) | FunctionDecl(body=body):
+                yield from _walk(body)
+            case IfStmt(then_branch=then_branch, else_branch=else_branch):
+                yield from _walk(then_branch)
+                yield from _walk(else_branch or [])
+            case CaseStmt(cases=cases, otherwise=otherwise):
+                for _, body in cases:
+                    yield from _walk(body)
+                yield from _walk(otherwise or [])
+            case ForStmt(body=body) | RepeatUntilStmt(body=body) | WhileStmt(
+                body=body
+            ):
+                yield from _walk(body)
+
+
+def _literal(value: Value, like: Literal | Identifier) -> Literal:
+    # Create a literal at the position of an existing node
+    token = like.token
+    return Literal(LiteralToken(line=token.line, column=token.column, value=value))
+
+
+class ConstantFolder(ExpressionVisitor, StatementVisitor):
+    """
+    Rewrites a syntax tree so that work which doesn't depend on the program's
+    input is done once, before the program runs.
+
+    - BinaryOp and UnaryOp nodes with only literal operands become literals
+    - Uses of constants are replaced by the constant's value
+    - CASE arms are folded, so literal arms don't need evaluating
+
+    The original tree isn't modified. Anything that would fail to evaluate
+    (e.g. a division by zero) is left for the interpreter to report.
+    """
+
+    constants: dict[str, Value]
+
+    def __init__(self):
+        self.constants = {}
+
+    @classmethod
+    def optimize(cls, program: Program) -> Program:
+        """
+        Folds the constant parts of a program
+        :param program: program to optimize
+        :return: an equivalent, optimized Program
+        """
+        return cls().visit(program)
+
+    def visit(self, thing: Expression | Statement):
+        if isinstance(thing, Expression):
+            return ExpressionVisitor.visit(self, thing)
+        else:
+            return StatementVisitor.visit(self, thing)
+
+    def visit_statements(self, statements: list[Statement]) -> list[Statement]:
+        return [self.visit(stmt) for stmt in statements]
+
+    def _expressions(self, expressions: list[Expression]) -> list[Expression]:
+        return [self.visit(expr) for expr in expressions]
+
+    def _assignable(self, target: ArrayIndex | Identifier) -> ArrayIndex | Identifier:
+        # Assignment targets are never inlined, only their indices are folded
+        if isinstance(target, ArrayIndex):
+            return ArrayIndex(target.array, self._expressions(target.index))
+        return target
+
+    def _type(self, type_: Type) -> Type:
+        if isinstance(type_, ArrayType):
+            ranges = [(self.visit(a), self.visit(b)) for a, b in type_.ranges]
+            return ArrayType(type_.type, ranges)
+        return type_
+
+    def _params(self, params):
+        if params is None:
+            return None
+        return [(name, self._type(type_)) for name, type_ in params]
+
+    def _inlinable_constants(self, program: Program) -> set[str]:
+        # Constants can be inlined if they are declared exactly once, at the
+        # top level, and the name is never also used for a variable
+        declared: list[str] = []
+        variables: set[str] = set()
+        for stmt in _walk(program.statements):
+            match stmt:
+                case ConstantDecl(name=name):
+                    declared.append(name.value)
+                case VariableDecl(name=name):
+                    variables.add(name.value)
+                case ForStmt(variable=Identifier(token=token)):
+                    variables.add(token.value)
+                case ProcedureDecl(params=params) | FunctionDecl(params=params):
+                    variables.update(name.value for name, _ in params or ())
+        top_level = {
+            stmt.name.value
+            for stmt in program.statements
+            if isinstance(stmt, ConstantDecl)
+        }
+        return {
+            name
+            for name in top_level
+            if declared.count(name) == 1 and name not in variables
+        }
+
+    # Expressions
+
+    def visit_binary_op(self, expr: BinaryOp) -> Expression:
+        left = self.visit(expr.left)
+        right = self.visit(expr.right)
+        if isinstance(left, Literal) and isinstance(right, Literal):
+            try:
+                return _literal(expr.operator(left.token.value, right.token.value), left)
+            except Exception:
+                pass
+        return BinaryOp(expr.operator, left, right)
+
+    def visit_unary_op(self, expr: UnaryOp) -> Expression:
+        operand = self.visit(expr.operand)
+        if isinstance(operand, Literal):
+            try:
+                return _literal(expr.operator(operand.token.value), operand)
+            except Exception:
+                pass
+        return UnaryOp(expr.operator, operand)
+
+    def visit_function_call(self, expr: FunctionCall) -> Expression:
+        # Calls are never evaluated, since builtins like RANDOM aren't pure
+        return FunctionCall(expr.function, self._expressions(expr.params))
+
+    def visit_array_index(self, expr: ArrayIndex) -> Expression:
+        return ArrayIndex(expr.array, self._expressions(expr.index))
+
+    def visit_literal(self, expr: Literal) -> Expression:
+        return expr
+
+    def visit_identifier(self, expr: Identifier) -> Expression:
+        name = expr.token.value
+        if name in self.constants:
+            return _literal(self.constants[name], expr)
+        return expr
+
+    # Statements
+
+    def visit_proc_decl(self, stmt: ProcedureDecl) -> Statement:
+        return ProcedureDecl(
+            stmt.name, self._params(stmt.params), self.visit_statements(stmt.body)
+        )
+
+    def visit_func_decl(self, stmt: FunctionDecl) -> Statement:
+        return FunctionDecl(
+            stmt.name,
+            self._params(stmt.params),
+            self._type(stmt.return_type),
+            self.visit_statements(stmt.body),
+        )
+
+    def visit_if(self, stmt: IfStmt) -> Statement:
+        return IfStmt(
+            self.visit(stmt.condition),
+            self.visit_statements(stmt.then_branch),
+            (
+                self.visit_statements(stmt.else_branch)
+                if stmt.else_branch is not None
+                else None
+            ),
+        )
+
+    def visit_case(self, stmt: CaseStmt) -> Statement:
+        return CaseStmt(
+            self.visit(stmt.expr),
+            [(self.visit(case), self.visit_statements(body)) for case, body in stmt.cases],
+            (
+                self.visit_statements(stmt.otherwise)
+                if stmt.otherwise is not None
+                else None
+            ),
+        )
+
+    def visit_for_loop(self, stmt: ForStmt) -> Statement:
+        return ForStmt(
+            self._assignable(stmt.variable),
+            self.visit(stmt.start),
+            self.visit(stmt.end),
+            self.visit(stmt.step) if stmt.step is not None else None,
+            self.visit_statements(stmt.body),
+        )
+
+    def visit_repeat_until(self, stmt: RepeatUntilStmt) -> Statement:
+        return RepeatUntilStmt(
+            self.visit_statements(stmt.body), self.visit(stmt.condition)
+        )
+
+    def visit_while(self, stmt: WhileStmt) -> Statement:
+        return WhileStmt(self.visit(stmt.condition), self.visit_statements(stmt.body))
+
+    def visit_variable_decl(self, stmt: VariableDecl) -> Statement:
+        return VariableDecl(stmt.name, self._type(stmt.vartype))
+
+    def visit_constant_decl(self, stmt: ConstantDecl) -> Statement:
+        return stmt
+
+    def visit_input(self, stmt: InputStmt) -> Statement:
+        return InputStmt(self._assignable(stmt.variable))
+
+    def visit_output(self, stmt: OutputStmt) -> Statement:
+        return OutputStmt(self._expressions(stmt.values))
+
+    def visit_return(self, stmt: ReturnStmt) -> Statement:
+        return ReturnStmt(self.visit(stmt.value))
+
+    def visit_f_open(self, stmt: FileOpenStmt) -> Statement:
+        return stmt
+
+    def visit_f_read(self, stmt: FileReadStmt) -> Statement:
+        return FileReadStmt(stmt.file, self._assignable(stmt.target))
+
+    def visit_f_write(self, stmt: FileWriteStmt) -> Statement:
+        return FileWriteStmt(stmt.file, self.visit(stmt.value))
+
+    def visit_f_close(self, stmt: FileCloseStmt) -> Statement:
+        return stmt
+
+    def visit_proc_call(self, stmt: ProcedureCallStmt) -> Statement:
+        if stmt.args is None:
+            return stmt
+        return ProcedureCallStmt(stmt.name, self._expressions(stmt.args))
+
+    def visit_assign(self, stmt: AssignmentStmt) -> Statement:
+        return AssignmentStmt(self._assignable(stmt.target), self.visit(stmt.value))
+
+    def visit_program(self, stmt: Program) -> Statement:
+        inlinable = self._inlinable_constants(stmt)
+        statements = []
+        for top_level in stmt.statements:
+            statements.append(self.visit(top_level))
+            # A constant is only inlined after its declaration has run, and
+            # everything after it at the top level runs later
+            if (
+                isinstance(top_level, ConstantDecl)
+                and top_level.name.value in inlinable
+            ):
+                self.constants[top_level.name.value] = top_level.value.value
+        return Program(statements)
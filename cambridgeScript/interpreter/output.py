@@ -0,0 +1,63 @@
+__all__ = [
+    "OutputWriter",
+]
+
+from typing import TextIO
+
+DEFAULT_BUFFER_SIZE = 1 << 16
+
+
+class OutputWriter:
+    """
+    Buffers the lines printed by OUTPUT statements.
+
+    Lines are collected in a list and written to the stream in one call once
+    they add up to buffer_size characters, and whenever flush is called (the
+    engines flush when a program ends, including when it raises an error).
+    Streams attached to a terminal are flushed after every line, so prompts
+    show up before the program waits for input. Passing an io.StringIO as
+    the stream captures the output in memory.
+    """
+
+    __slots__ = ("stream", "buffer_size", "line_buffered", "_lines", "_size")
+
+    stream: TextIO
+    buffer_size: int
+    line_buffered: bool
+
+    def __init__(
+        self,
+        stream: TextIO,
+        buffer_size: int = DEFAULT_BUFFER_SIZE,
+        line_buffered: bool | None = None,
+    ):
+        """
+        :param stream: text stream to write to
+        :param buffer_size: number of characters to buffer before writing
+        :param line_buffered: whether to write every line straight away,
+            defaults to whether the stream is a terminal
+        """
+        self.stream = stream
+        self.buffer_size = buffer_size
+        if line_buffered is None:
+            isatty = getattr(stream, "isatty", None)
+            line_buffered = isatty is not None and isatty()
+        self.line_buffered = line_buffered
+        self._lines: list[str] = []
+        self._size = 0
+
+    def write_line(self, line: str) -> None:
+        """Writes a line of output, without its trailing newline."""
+        self._lines.append(line)
+        self._size += len(line) + 1
+        if self.line_buffered or self._size >= self.buffer_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """Writes every buffered line to the stream, then flushes it."""
+        if self._lines:
+            self._lines.append("")
+            self.stream.write("\n".join(self._lines))
+            self._lines.clear()
+            self._size = 0
+        self.stream.flush()
@@ -0,0 +1,285 @@
+__all__ = [
+    "LineStats",
+    "SubroutineStats",
+    "Profile",
+    "ProfilingInterpreter",
+    "ProfilingCompiler",
+]
+
+import time
+from dataclasses import dataclass
+from typing import Any, TextIO
+
+from cambridgeScript.interpreter.compiler import Compiler, Thunk
+from cambridgeScript.interpreter.interpreter import Interpreter
+from cambridgeScript.parser.lexer import Value
+from cambridgeScript.syntax_tree import (
+    Expression,
+    FunctionCall,
+    FunctionDecl,
+    ProcedureCallStmt,
+    ProcedureDecl,
+    Program,
+    Statement,
+    first_line,
+)
+
+_PROGRAM = "<program>"
+
+
+@dataclass
+class LineStats:
+    """What a profiled program spent on one line of source code."""
+
+    # Number of statements on the line that ran
+    count: int = 0
+    # Seconds spent on the line itself, excluding statements nested in it
+    # and the subroutines it called
+    time: float = 0.0
+    # Seconds spent on the line including everything it ran
+    total_time: float = 0.0
+
+
+@dataclass
+class SubroutineStats:
+    """What a profiled program spent in one subroutine."""
+
+    calls: int = 0
+    # Seconds spent in the subroutine, recursive calls only counted once
+    total_time: float = 0.0
+
+
+class Profile:
+    """
+    Statistics collected while a program runs under ProfilingInterpreter or
+    ProfilingCompiler.
+
+    `stacks` maps collapsed stacks (the running subroutines from the
+    outermost, then the line, separated by semicolons) to the seconds spent
+    in them, which is the input format of flame graph tools.
+    """
+
+    lines: dict[int, LineStats]
+    subroutines: dict[str, SubroutineStats]
+    stacks: dict[str, float]
+
+    def __init__(self):
+        self.lines = {}
+        self.subroutines = {}
+        self.stacks = {}
+        # [line, start, time spent in nested statements] of running statements
+        self._statements: list[list] = []
+        # (name, start) of running subroutines
+        self._calls: list[tuple[str, float]] = []
+        self._stack = _PROGRAM
+        # Number of times each line or subroutine is running, so recursion
+        # isn't counted more than once in the totals
+        self._active_lines: dict[int, int] = {}
+        self._active_subroutines: dict[str, int] = {}
+
+    def start_line(self, line: int) -> None:
+        """Records that a statement on a line started running."""
+        stats = self.lines.get(line)
+        if stats is None:
+            stats = self.lines[line] = LineStats()
+        stats.count += 1
+        self._active_lines[line] = self._active_lines.get(line, 0) + 1
+        self._statements.append([line, time.perf_counter(), 0.0])
+
+    def stop_line(self) -> None:
+        """Records that the last statement started has finished."""
+        line, start, nested = self._statements.pop()
+        elapsed = time.perf_counter() - start
+        stats = self.lines[line]
+        stats.time += elapsed - nested
+        stack = f"{self._stack};line {line}"
+        self.stacks[stack] = self.stacks.get(stack, 0.0) + elapsed - nested
+        self._active_lines[line] -= 1
+        if not self._active_lines[line]:
+            stats.total_time += elapsed
+        if self._statements:
+            self._statements[-1][2] += elapsed
+
+    def enter(self, name: str) -> None:
+        """Records that a subroutine was called."""
+        stats = self.subroutines.get(name)
+        if stats is None:
+            stats = self.subroutines[name] = SubroutineStats()
+        stats.calls += 1
+        self._active_subroutines[name] = self._active_subroutines.get(name, 0) + 1
+        self._calls.append((name, time.perf_counter()))
+        self._stack = f"{self._stack};{name}"
+
+    @property
+    def depth(self) -> int:
+        """Number of subroutine calls running."""
+        return len(self._calls)
+
+    def leave(self) -> None:
+        """Records that the last subroutine called has returned."""
+        name, start = self._calls.pop()
+        elapsed = time.perf_counter() - start
+        self._stack = self._stack.rpartition(";")[0]
+        self._active_subroutines[name] -= 1
+        if not self._active_subroutines[name]:
+            self.subroutines[name].total_time += elapsed
+
+    def report(self, origin: list[str], limit: int = 20) -> str:
+        """
+        Formats the hottest lines and the subroutines as a table
+        :param origin: source code of the program
+        :param limit: number of lines to include
+        :return: the report
+        """
+        rows = [
+            f"{'Line':>6} {'Count':>10} {'Time (ms)':>11} {'Total (ms)':>11}  Code"
+        ]
+        hot = sorted(
+            self.lines.items(), key=lambda item: item[1].time, reverse=True
+        )
+        for line, stats in hot[:limit]:
+            code = origin[line - 1].strip() if 1 <= line <= len(origin) else ""
+            rows.append(
+                f"{line:>6} {stats.count:>10} {stats.time * 1000:>11.3f} "
+                f"{stats.total_time * 1000:>11.3f}  {code}"
+            )
+        if self.subroutines:
+            rows.append("")
+            rows.append(f"{'Subroutine':<20} {'Calls':>10} {'Total (ms)':>11}")
+            by_time = sorted(
+                self.subroutines.items(),
+                key=lambda item: item[1].total_time,
+                reverse=True,
+            )
+            for name, stats in by_time:
+                rows.append(
+                    f"{name:<20} {stats.calls:>10} {stats.total_time * 1000:>11.3f}"
+                )
+        return "\n".join(rows)
+
+    def write_collapsed(self, stream: TextIO) -> None:
+        """
+        Writes the collapsed stacks, one "stack microseconds" pair per line
+        :param stream: text stream to write to
+        """
+        for stack, seconds in sorted(self.stacks.items()):
+            if (microseconds := round(seconds * 1_000_000)) > 0:
+                stream.write(f"{stack} {microseconds}\n")
+
+
+class ProfilingInterpreter(Interpreter):
+    """
+    Interpreter that records a Profile of the program it runs.
+
+    Profiling only happens in this subclass, so the plain Interpreter pays
+    nothing for it.
+    """
+
+    profile: Profile
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.profile = Profile()
+        self._lines: dict[int, int | None] = {}
+
+    def visit(self, thing: Expression | Statement):
+        if isinstance(thing, (Expression, Program)):
+            return super().visit(thing)
+        key = id(thing)
+        if key not in self._lines:
+            self._lines[key] = first_line(thing)
+        line = self._lines[key]
+        if line is None:
+            return super().visit(thing)
+        self.profile.start_line(line)
+        try:
+            return super().visit(thing)
+        finally:
+            self.profile.stop_line()
+
+    def enter_subroutine(
+        self, decl: ProcedureDecl | FunctionDecl, args: list[Value], line: int
+    ) -> None:
+        super().enter_subroutine(decl, args, line)
+        # Arguments have been evaluated, so the call starts here
+        self.profile.enter(decl.name.value)
+
+    def visit_function_call(self, func_call: FunctionCall):
+        depth = self.profile.depth
+        try:
+            return super().visit_function_call(func_call)
+        finally:
+            if self.profile.depth > depth:
+                self.profile.leave()
+
+    def visit_proc_call(self, stmt: ProcedureCallStmt) -> None:
+        depth = self.profile.depth
+        try:
+            return super().visit_proc_call(stmt)
+        finally:
+            if self.profile.depth > depth:
+                self.profile.leave()
+
+
+class ProfilingCompiler(Compiler):
+    """
+    Compiler whose closures record a Profile of the program as they run.
+
+    Every statement's closure is wrapped in one that times it, and every
+    subroutine body in one that counts the call. Closures compiled by the
+    plain Compiler aren't wrapped, so they pay nothing for it.
+    """
+
+    profile: Profile
+
+    def __init__(self, interpreter: Interpreter, profile: Profile | None = None):
+        """
+        :param interpreter: interpreter whose state the closures run against
+        :param profile: profile to record into, defaults to a new one
+        """
+        super().__init__(interpreter)
+        self.profile = profile if profile is not None else Profile()
+
+    def compile(self, thing: Expression | Statement) -> Thunk:
+        thunk = super().compile(thing)
+        if isinstance(thing, (Expression, Program)):
+            return thunk
+        line = first_line(thing)
+        if line is None:
+            return thunk
+        start_line = self.profile.start_line
+        stop_line = self.profile.stop_line
+
+        def profiled() -> Any:
+            start_line(line)
+            try:
+                return thunk()
+            finally:
+                stop_line()
+
+        return profiled
+
+    def visit_proc_decl(self, stmt: ProcedureDecl) -> Thunk:
+        thunk = super().visit_proc_decl(stmt)
+        self._profile_body(stmt)
+        return thunk
+
+    def visit_func_decl(self, stmt: FunctionDecl) -> Thunk:
+        thunk = super().visit_func_decl(stmt)
+        self._profile_body(stmt)
+        return thunk
+
+    def _profile_body(self, stmt: ProcedureDecl | FunctionDecl) -> None:
+        body = self._bodies[id(stmt)]
+        name = stmt.name.value
+        enter = self.profile.enter
+        leave = self.profile.leave
+
+        def profiled_body() -> Any:
+            enter(name)
+            try:
+                return body()
+            finally:
+                leave()
+
+        self._bodies[id(stmt)] = profiled_body
@@ -0,0 +1,275 @@
+__all__ = [
+    "Scope",
+    "Resolution",
+    "Resolver",
+]
+
+from dataclasses import dataclass, field
+from typing import Iterator
+
+from cambridgeScript.syntax_tree import (
+    Expression,
+    Identifier,
+    Literal,
+    ArrayIndex,
+    FunctionCall,
+    UnaryOp,
+    BinaryOp,
+    Statement,
+    AssignmentStmt,
+    ProcedureCallStmt,
+    FileCloseStmt,
+    FileWriteStmt,
+    FileReadStmt,
+    FileOpenStmt,
+    ReturnStmt,
+    OutputStmt,
+    InputStmt,
+    ConstantDecl,
+    VariableDecl,
+    WhileStmt,
+    RepeatUntilStmt,
+    ForStmt,
+    CaseStmt,
+    IfStmt,
+    FunctionDecl,
+    ProcedureDecl,
+    Program,
+)
+from cambridgeScript.syntax_tree.types import ArrayType, Type
+from cambridgeScript.syntax_tree.visitors import ExpressionVisitor, StatementVisitor
+
+
+@dataclass
+class Scope:
+    """Slot indices of the variables that live in one frame."""
+
+    # Variable name -> slot index
+    names: dict[str, int] = field(default_factory=dict)
+
+    @property
+    def size(self) -> int:
+        return len(self.names)
+
+    def slot(self, name: str) -> int:
+        """Return the slot for a variable name, allocating one if needed."""
+        if (slot := self.names.get(name)) is None:
+            slot = self.names[name] = len(self.names)
+        return slot
+
+
+@dataclass
+class Resolution:
+    """
+    Slot indices assigned to the variables of a program.
+
+    Nodes are keyed by identity, since syntax tree nodes aren't hashable.
+    """
+
+    globals: Scope = field(default_factory=Scope)
+    # id(ProcedureDecl | FunctionDecl) -> scope of the subroutine's locals
+    scopes: dict[int, Scope] = field(default_factory=dict)
+    # id(Identifier | VariableDecl) -> (whether the slot is local, slot index)
+    slots: dict[int, tuple[bool, int]] = field(default_factory=dict)
+    # id(ProcedureDecl | FunctionDecl) -> local slot index of each parameter
+    params: dict[int, tuple[int, ...]] = field(default_factory=dict)
+
+
+def _declarations(statements: list[Statement]) -> Iterator[tuple[str, bool]]:
+    # Yields (name, whether it is DECLAREd) for variables that are declared or
+    # used as a FOR variable, not counting those inside nested subroutines
+    for stmt in statements:
+        match stmt:
+            case VariableDecl(name=name):
+                yield name.value, True
+            case ForStmt(variable=Identifier(token=token), body=body):
+                yield token.value, False
+                yield from _declarations(body)
+            case IfStmt(then_branch=then_branch, else_branch=else_branch):
+                yield from _declarations(then_branch)
+                yield from _declarations(else_branch or [])
+            case CaseStmt(cases=cases, otherwise=otherwise):
+                for _, body in cases:
+                    yield from _declarations(body)
+                yield from _declarations(otherwise or [])
+            case RepeatUntilStmt(body=body) | WhileStmt(body=body):
+                yield from _declarations(body)
+
+
+class Resolver(ExpressionVisitor, StatementVisitor):
+    """
+    Assigns every variable of a program a fixed slot index.
+
+    Variables declared at the top level (or used there as a FOR variable)
+    are globals. Inside a subroutine, parameters, the variables it declares
+    and FOR variables without a DECLAREd global are locals that live in the
+    subroutine's own frame; any other name refers to the global of that name.
+    """
+
+    resolution: Resolution
+    scope: Scope | None
+
+    def __init__(self, resolution: Resolution | None = None):
+        self.resolution = resolution or Resolution()
+        # Scope of the subroutine being resolved, None at the top level
+        self.scope = None
+        self._declared_globals: set[str] = set()
+
+    @classmethod
+    def resolve(cls, program: Program) -> Resolution:
+        """
+        Resolves the variables of a program
+        :param program: program to resolve
+        :return: the slots of the program's variables
+        """
+        resolver = cls()
+        resolver.visit(program)
+        return resolver.resolution
+
+    def visit(self, thing: Expression | Statement) -> None:
+        if isinstance(thing, Expression):
+            ExpressionVisitor.visit(self, thing)
+        else:
+            StatementVisitor.visit(self, thing)
+
+    def visit_statements(self, statements: list[Statement]) -> None:
+        for stmt in statements:
+            self.visit(stmt)
+
+    def _lookup(self, name: str) -> tuple[bool, int]:
+        if self.scope is not None and name in self.scope.names:
+            return True, self.scope.names[name]
+        return False, self.resolution.globals.slot(name)
+
+    def _type(self, type_: Type) -> None:
+        if isinstance(type_, ArrayType):
+            for a, b in type_.ranges:
+                self.visit(a)
+                self.visit(b)
+
+    def _subroutine(self, stmt: ProcedureDecl | FunctionDecl) -> None:
+        enclosing = self.scope
+        scope = self.resolution.scopes[id(stmt)] = Scope()
+        for _, type_ in stmt.params or ():
+            self._type(type_)
+        self.resolution.params[id(stmt)] = tuple(
+            scope.slot(name.value) for name, _ in stmt.params or ()
+        )
+        for name, declared in _declarations(stmt.body):
+            # FOR variables only use the global of the same name if the
+            # global was DECLAREd, otherwise they are local
+            if declared or name not in self._declared_globals:
+                scope.slot(name)
+        self.scope = scope
+        self.visit_statements(stmt.body)
+        self.scope = enclosing
+
+    # Expressions
+
+    def visit_binary_op(self, expr: BinaryOp) -> None:
+        self.visit(expr.left)
+        self.visit(expr.right)
+
+    def visit_unary_op(self, expr: UnaryOp) -> None:
+        self.visit(expr.operand)
+
+    def visit_function_call(self, expr: FunctionCall) -> None:
+        # The function name isn't a variable, so only the arguments are resolved
+        for param in expr.params:
+            self.visit(param)
+
+    def visit_array_index(self, expr: ArrayIndex) -> None:
+        self.visit(expr.array)
+        for index in expr.index:
+            self.visit(index)
+
+    def visit_literal(self, expr: Literal) -> None:
+        pass
+
+    def visit_identifier(self, expr: Identifier) -> None:
+        self.resolution.slots[id(expr)] = self._lookup(expr.token.value)
+
+    # Statements
+
+    def visit_proc_decl(self, stmt: ProcedureDecl) -> None:
+        self._subroutine(stmt)
+
+    def visit_func_decl(self, stmt: FunctionDecl) -> None:
+        self._subroutine(stmt)
+        self._type(stmt.return_type)
+
+    def visit_if(self, stmt: IfStmt) -> None:
+        self.visit(stmt.condition)
+        self.visit_statements(stmt.then_branch)
+        if stmt.else_branch is not None:
+            self.visit_statements(stmt.else_branch)
+
+    def visit_case(self, stmt: CaseStmt) -> None:
+        self.visit(stmt.expr)
+        for case, body in stmt.cases:
+            self.visit(case)
+            self.visit_statements(body)
+        if stmt.otherwise is not None:
+            self.visit_statements(stmt.otherwise)
+
+    def visit_for_loop(self, stmt: ForStmt) -> None:
+        self.visit(stmt.variable)
+        self.visit(stmt.start)
+        self.visit(stmt.end)
+        if stmt.step is not None:
+            self.visit(stmt.step)
+        self.visit_statements(stmt.body)
+
+    def visit_repeat_until(self, stmt: RepeatUntilStmt) -> None:
+        self.visit_statements(stmt.body)
+        self.visit(stmt.condition)
+
+    def visit_while(self, stmt: WhileStmt) -> None:
+        self.visit(stmt.condition)
+        self.visit_statements(stmt.body)
+
+    def visit_variable_decl(self, stmt: VariableDecl) -> None:
+        self._type(stmt.vartype)
+        self.resolution.slots[id(stmt)] = self._lookup(stmt.name.value)
+
+    def visit_constant_decl(self, stmt: ConstantDecl) -> None:
+        pass
+
+    def visit_input(self, stmt: InputStmt) -> None:
+        self.visit(stmt.variable)
+
+    def visit_output(self, stmt: OutputStmt) -> None:
+        for value in stmt.values:
+            self.visit(value)
+
+    def visit_return(self, stmt: ReturnStmt) -> None:
+        self.visit(stmt.value)
+
+    def visit_f_open(self, stmt: FileOpenStmt) -> None:
+        pass
+
+    def visit_f_read(self, stmt: FileReadStmt) -> None:
+        self.visit(stmt.target)
+
+    def visit_f_write(self, stmt: FileWriteStmt) -> None:
+        self.visit(stmt.value)
+
+    def visit_f_close(self, stmt: FileCloseStmt) -> None:
+        pass
+
+    def visit_proc_call(self, stmt: ProcedureCallStmt) -> None:
+        for arg in stmt.args or ():
+            self.visit(arg)
+
+    def visit_assign(self, stmt: AssignmentStmt) -> None:
+        self.visit(stmt.target)
+        self.visit(stmt.value)
+
+    def visit_program(self, stmt: Program) -> None:
+        # Globals are allocated first, so that subroutines declared before
+        # them still refer to the globals
+        for name, declared in _declarations(stmt.statements):
+            self.resolution.globals.slot(name)
+            if declared:
+                self._declared_globals.add(name)
+        self.visit_statements(stmt.statements)
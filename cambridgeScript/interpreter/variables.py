@@ -1,70 +1,121 @@
 from dataclasses import dataclass, field
 from typing import Any
-from functools import reduce
 
 from cambridgeScript.parser.lexer import Value
 from cambridgeScript.syntax_tree import FunctionDecl, ProcedureDecl
 from cambridgeScript.syntax_tree.types import Type, ArrayType
 
 
+class Array:
+    """
+    Runtime value of an array variable.
+
+    The bounds are evaluated once when the array is declared, and the cells
+    are stored flat in row-major order.
+    """
+
+    __slots__ = ("cells", "ranges", "strides")
+
+    cells: list[Value | None]
+    ranges: list[tuple[int, int]]
+    strides: tuple[int, ...]
+
+    def __init__(self, ranges: list[tuple[int, int]], default: Any = None):
+        self.ranges = ranges
+        strides = []
+        size = 1
+        for start, end in reversed(ranges):
+            strides.append(size)
+            size *= max(end - start + 1, 0)
+        self.strides = tuple(reversed(strides))
+        self.cells = [default] * size
+
+    def copy(self) -> "Array":
+        """Returns an array with the same bounds and a copy of the cells."""
+        array = Array.__new__(Array)
+        array.ranges = self.ranges
+        array.strides = self.strides
+        array.cells = self.cells.copy()
+        return array
+
+    def offset(self, indices: list[int]) -> int:
+        """Convert user indices into an offset in the flat storage."""
+        if len(indices) != len(self.ranges):
+            raise IndexError("wrong number of indices")
+        offset = 0
+        for i, (start, end), stride in zip(indices, self.ranges, self.strides):
+            if not start <= i <= end:
+                raise IndexError("array index out of range")
+            offset += (i - start) * stride
+        return offset
+
+
+class Frame:
+    """
+    Variables of one scope, stored in slots assigned by the Resolver.
+
+    A slot whose type is None holds a variable that hasn't been declared.
+    """
+
+    __slots__ = ("values", "types")
+
+    values: list[Array | Value | None]
+    types: list[Type | None]
+
+    def __init__(self, size: int = 0):
+        self.values = [None] * size
+        self.types = [None] * size
+
+    def allocate(self, size: int) -> None:
+        """Make sure there are at least `size` slots."""
+        # The lists are extended in place so references to them stay valid
+        missing = size - len(self.values)
+        if missing > 0:
+            self.values.extend([None] * missing)
+            self.types.extend([None] * missing)
+
+    def declare(self, slot: int, value: Any, vartype: Type) -> None:
+        """Declare the variable in a slot with an initial value."""
+        self.values[slot] = value
+        self.types[slot] = vartype
+
+    def get_array_value(self, slot: int, indices: list[int]) -> Value:
+        """Get value from array at given indices."""
+        array = self.values[slot]
+        return array.cells[array.offset(indices)]
+
+    def set_array_value(self, slot: int, indices: list[int], value: Value) -> None:
+        """Set value in array at given indices."""
+        array = self.values[slot]
+        array.cells[array.offset(indices)] = value
+
+
 @dataclass
 class VariableState:
-    variables: dict[str, tuple[list[Value] | Value | None, Type]] = field(
-        default_factory=dict
-    )
+    globals: Frame = field(default_factory=Frame)
+    # Frame of the running subroutine, or the global frame at the top level
+    frame: Frame = None  # type: ignore
     constants: dict[str, Value] = field(default_factory=dict)
     functions: dict[str, FunctionDecl] = field(default_factory=dict)
     procedures: dict[str, ProcedureDecl] = field(default_factory=dict)
-    variable_stack: list[dict[str, tuple[list[Value] | Value | None, Type]]] = field(
-        default_factory=list
-    )
+    frame_stack: list[Frame] = field(default_factory=list)
+
+    def __post_init__(self):
+        if self.frame is None:
+            self.frame = self.globals
 
-    def push_scope(self) -> None:
-        """Push current variable scope onto stack and create new scope."""
-        self.variable_stack.append(self.variables.copy())
-        self.variables = self.variables.copy()
+    def push_scope(self, size: int) -> None:
+        """Enter a subroutine with `size` local variables."""
+        self.frame_stack.append(self.frame)
+        self.frame = Frame(size)
 
     def pop_scope(self) -> None:
-        """Restore previous variable scope."""
-        if self.variable_stack:
-            current_scope = self.variables
-            self.variables = self.variable_stack.pop()
-            # Update any modified variables in the parent scope
-            for var in self.variables.keys():
-                if var in current_scope:
-                    self.variables[var] = current_scope[var]
+        """Return to the frame that was running before push_scope."""
+        if self.frame_stack:
+            self.frame = self.frame_stack.pop()
 
     def create_nd_array(
         self, ranges: list[tuple[int, int]], default: Any = None
-    ) -> list:
+    ) -> Array:
         """Create an n-dimensional array."""
-        if not ranges:
-            return default
-        start, end = ranges[0]
-        # Create array from 0 to size-1, where size matches the range
-        size = end - start + 1
-        return [self.create_nd_array(ranges[1:], default) for _ in range(size)]
-
-    def get_array_value(
-        self, name: str, indices: list[int], ranges: list[tuple[int, int]]
-    ) -> Value:
-        """Get value from array at given indices."""
-        # Convert user indices to zero-based indices for internal array access
-        internal_indices = [i - start for i, (start, _) in zip(indices, ranges)]
-        target = reduce(
-            lambda x, i: x[i],
-            internal_indices,
-            self.variables[name][0].copy(),
-        )
-        return target
-
-    def set_array_value(
-        self, name: str, indices: list[int], value: Value, ranges: list[tuple[int, int]]
-    ) -> None:
-        """Set value in array at given indices."""
-        # Convert user indices to zero-based indices for internal array access
-        internal_indices = [i - start for i, (start, _) in zip(indices, ranges)]
-        arrcpy = self.variables[name][0].copy()
-        target = reduce(lambda x, i: x[i], internal_indices[:-1], arrcpy)
-        target[internal_indices[-1]] = value
-        self.variables[name] = (arrcpy, self.variables[name][1])
+        return Array(ranges, default)
@@ -0,0 +1,247 @@
+__all__ = [
+    "DiskCache",
+    "ParseCache",
+]
+
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from functools import lru_cache
+from pathlib import Path
+
+from cambridgeScript import __version__
+from cambridgeScript.parser.lexer import parse_tokens
+from cambridgeScript.parser.parser import Parser
+from cambridgeScript.syntax_tree import Program
+
+# Bumped whenever the layout of cache files changes
+_FORMAT = 3
+_MAGIC = b"CSPC"
+_SUFFIX = ".cspc"
+# Modules that decide what a parsed program looks like, relative to the package
+_SCHEMA_SOURCES = (
+    "constants.py",
+    "parser/lexer.py",
+    "parser/parser.py",
+    "syntax_tree/*.py",
+)
+
+
+@lru_cache(maxsize=1)
+def _schema() -> bytes:
+    # Digest of the lexer, parser and syntax tree sources, so programs parsed
+    # before any of them changed aren't loaded even if _FORMAT wasn't bumped
+    package = Path(__file__).resolve().parent.parent
+    digest = hashlib.sha256()
+    for pattern in _SCHEMA_SOURCES:
+        # Installs without the sources fall back to the version and _FORMAT
+        for path in sorted(package.glob(pattern)):
+            digest.update(path.read_bytes())
+    return digest.digest()
+
+
+def _default_directory() -> Path:
+    base = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(base) / "cambridgeScript"
+
+
+class DiskCache:
+    """
+    Parsed programs stored on disk, keyed by a hash of the source code, the
+    interpreter version and the sources of the lexer, parser and syntax tree.
+
+    Each entry is a small header followed by the zlib-compressed pickle of
+    the Program. An entry is only used if its header matches the source and
+    version it's looked up with, anything else is treated as a miss. Entries
+    are evicted once they haven't been used for `max_age` seconds, and the
+    least recently used entries go first while the cache is over `max_size`
+    bytes.
+    """
+
+    directory: Path
+    max_size: int
+    max_age: float
+
+    def __init__(
+        self,
+        directory: str | os.PathLike | None = None,
+        max_size: int = 64 * 1024 * 1024,
+        max_age: float = 7 * 24 * 60 * 60,
+    ):
+        self.directory = Path(directory) if directory is not None else _default_directory()
+        self.max_size = max_size
+        self.max_age = max_age
+
+    def key(self, code: str) -> bytes:
+        """Return the digest that identifies a program's cache entry."""
+        digest = hashlib.sha256(f"{__version__}\0{_FORMAT}\0".encode())
+        digest.update(_schema())
+        digest.update(code.encode())
+        return digest.digest()
+
+    def _path(self, key: bytes) -> Path:
+        return self.directory / (key.hex() + _SUFFIX)
+
+    def load(self, code: str) -> Program | None:
+        """
+        Loads the parsed form of a program from the cache
+        :param code: source code of the program
+        :return: the cached Program, or None if there is no valid entry
+        """
+        key = self.key(code)
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+        except OSError:
+            return None
+        header = _MAGIC + key
+        if not data.startswith(header):
+            return None
+        try:
+            program = pickle.loads(zlib.decompress(data[len(header) :]))
+        except Exception:
+            # Truncated or corrupted entry
+            return None
+        if not isinstance(program, Program):
+            return None
+        try:
+            # Entries age from when they were last used
+            os.utime(path)
+        except OSError:
+            pass
+        return program
+
+    def store(self, code: str, program: Program) -> None:
+        """
+        Stores the parsed form of a program, then evicts old entries.
+        Failing to write the cache isn't an error.
+        :param code: source code of the program
+        :param program: the program parsed from code
+        """
+        key = self.key(code)
+        try:
+            data = zlib.compress(
+                pickle.dumps(program, protocol=pickle.HIGHEST_PROTOCOL)
+            )
+        except (pickle.PicklingError, RecursionError):
+            return
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            # Written to a temporary file first, so that other processes
+            # never read a partially written entry
+            fd, temp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as file:
+                    file.write(_MAGIC + key + data)
+                os.replace(temp, self._path(key))
+            except BaseException:
+                os.unlink(temp)
+                raise
+        except OSError:
+            return
+        self.evict()
+
+    def evict(self) -> None:
+        """Delete expired entries, then the oldest ones until under max_size."""
+        now = time.time()
+        entries = []
+        try:
+            paths = list(self.directory.glob("*" + _SUFFIX))
+        except OSError:
+            return
+        for path in paths:
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            if now - stat.st_mtime > self.max_age:
+                path.unlink(missing_ok=True)
+            else:
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+    def parse(self, code: str) -> Program:
+        """
+        Parses a program, using the cache if it has a valid entry
+        :param code: source code of the program
+        :return: the parsed Program
+        """
+        program = self.load(code)
+        if program is None:
+            program = Parser.parse_program(parse_tokens(code), code)
+            self.store(code, program)
+        return program
+
+
+class ParseCache:
+    """
+    Parsed programs kept in memory, keyed by a hash of the source code.
+
+    Holds up to `max_size` programs, dropping the least recently used one when
+    it's full. A Program is shared by everyone who parses the same source, so
+    it must be treated as immutable (the syntax tree nodes are frozen, but the
+    lists in them aren't). If `disk` is given, it's used on a miss before
+    parsing. The cache can be shared between threads.
+    """
+
+    max_size: int
+    disk: DiskCache | None
+    hits: int
+    misses: int
+
+    def __init__(self, max_size: int = 128, disk: DiskCache | None = None):
+        self.max_size = max_size
+        self.disk = disk
+        self.hits = 0
+        self.misses = 0
+        self._programs: OrderedDict[bytes, Program] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._programs)
+
+    def parse(self, code: str) -> Program:
+        """
+        Parses a program, reusing the result of an earlier call with the same
+        source code
+        :param code: source code of the program
+        :return: the parsed Program
+        """
+        key = hashlib.sha256(code.encode()).digest()
+        with self._lock:
+            program = self._programs.get(key)
+            if program is not None:
+                self._programs.move_to_end(key)
+                self.hits += 1
+                return program
+            self.misses += 1
+        # Parsed outside the lock, so a slow parse doesn't hold up other
+        # threads (two threads may parse the same program at once)
+        if self.disk is not None:
+            program = self.disk.parse(code)
+        else:
+            program = Parser.parse_program(parse_tokens(code), code)
+        with self._lock:
+            self._programs[key] = program
+            while len(self._programs) > self.max_size:
+                self._programs.popitem(last=False)
+        return program
+
+    def clear(self) -> None:
+        """Remove every program and reset the counters."""
+        with self._lock:
+            self._programs.clear()
+            self.hits = 0
+            self.misses = 0
+
@@ -9,10 +9,15 @@ __all__ = [
     "IdentifierToken",
     "EOFToken",
     "parse_tokens",
+    "iter_tokens",
 ]
 
+import io
+import mmap
 import re
-from dataclasses import dataclass
+import string
+from typing import BinaryIO, Iterator, TextIO
+from dataclasses import FrozenInstanceError
 
 from cambridgeScript.constants import Keyword, Symbol
 
@@ -29,7 +34,8 @@ Value = str | int | float | bool | char
 
 
 class _EOFSentinel:
-    pass
+    def __str__(self) -> str:
+        return "end of file"
 
 
 EOF = _EOFSentinel()
@@ -56,23 +62,78 @@ class InvalidTokenError(ValueError):
         return self.prompt + "\n" + self.parse_traceback(self.origin, self.line)
 
 
-@dataclass(frozen=True)
 class Token:
+    """
+    Base class of tokens.
+
+    Tokens are immutable. A program has one for every word and symbol, so they
+    use __slots__ rather than being dataclasses, and set their fields through
+    the slot descriptors instead of object.__setattr__.
+    """
+
+    __slots__ = ("line", "column")
+    # Fields compared, hashed, pickled and shown in repr
+    _fields: tuple[str, ...] = ("line", "column")
+
     line: int | None
     column: int | None
+    # The Keyword or Symbol of the token (or EOF), for the parser to compare
+    # by identity. None for literals and identifiers.
+    kind: Keyword | Symbol | _EOFSentinel | None = None
+
+    def __init__(self, line: int | None, column: int | None):
+        _set_line(self, line)
+        _set_column(self, column)
+
+    def __setattr__(self, name, value):
+        raise FrozenInstanceError(f"cannot assign to field {name!r}")
+
+    def __delattr__(self, name):
+        raise FrozenInstanceError(f"cannot delete field {name!r}")
+
+    def _values(self) -> tuple:
+        return tuple(getattr(self, name) for name in self._fields)
+
+    def __repr__(self) -> str:
+        fields = ", ".join(
+            f"{name}={getattr(self, name)!r}" for name in self._fields
+        )
+        return f"{type(self).__name__}({fields})"
+
+    def __eq__(self, other):
+        if other.__class__ is self.__class__:
+            return self._values() == other._values()
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self._values())
+
+    def __reduce__(self):
+        return type(self), self._values()
 
     @property
     def location(self) -> str:
         return f"Line {self.line} Column {self.column}"
 
 
+_set_line = Token.line.__set__
+_set_column = Token.column.__set__
+
+
 TokenComparable = Token | Keyword | Symbol | str | Value | _EOFSentinel
 
 
-@dataclass(frozen=True)
 class KeywordToken(Token):
+    __slots__ = ("keyword",)
+    _fields = ("line", "column", "keyword")
+
     keyword: Keyword
 
+    def __init__(self, line: int | None, column: int | None, keyword: Keyword):
+        _set_line(self, line)
+        _set_column(self, column)
+        _set_keyword(self, keyword)
+
     def __eq__(self, other):
         if isinstance(other, Keyword):
             return self.keyword == other
@@ -82,10 +143,21 @@ class KeywordToken(Token):
         return hash(self.keyword)
 
 
-@dataclass(frozen=True)
+_set_keyword = KeywordToken.keyword.__set__
+KeywordToken.kind = KeywordToken.keyword
+
+
 class SymbolToken(Token):
+    __slots__ = ("symbol",)
+    _fields = ("line", "column", "symbol")
+
     symbol: Symbol
 
+    def __init__(self, line: int | None, column: int | None, symbol: Symbol):
+        _set_line(self, line)
+        _set_column(self, column)
+        _set_symbol(self, symbol)
+
     def __eq__(self, other):
         if isinstance(other, Symbol):
             return self.symbol == other
@@ -95,72 +167,80 @@ class SymbolToken(Token):
         return hash(self.symbol)
 
 
-@dataclass(frozen=True)
+_set_symbol = SymbolToken.symbol.__set__
+SymbolToken.kind = SymbolToken.symbol
+
+
 class LiteralToken(Token):
+    __slots__ = ("value",)
+    _fields = ("line", "column", "value")
+
     value: Value
 
+    def __init__(self, line: int | None, column: int | None, value: Value):
+        _set_line(self, line)
+        _set_column(self, column)
+        _set_literal(self, value)
+
     @property
     def type(self):
         return type(self.value)
 
 
-@dataclass(frozen=True)
+_set_literal = LiteralToken.value.__set__
+
+
 class IdentifierToken(Token):
+    __slots__ = ("value",)
+    _fields = ("line", "column", "value")
+
     value: str
 
+    def __init__(self, line: int | None, column: int | None, value: str):
+        _set_line(self, line)
+        _set_column(self, column)
+        _set_name(self, value)
+
     def __eq__(self, other):
         return self.value == other or super().__eq__(other)
 
+    __hash__ = Token.__hash__
+
+
+_set_name = IdentifierToken.value.__set__
+
 
-@dataclass(frozen=True)
 class EOFToken(Token):
+    __slots__ = ()
+    kind = EOF
+
     def __eq__(self, other):
         if other is EOF:
             return True
         return super().__eq__(other)
 
+    __hash__ = Token.__hash__
 
-_TOKENS = [
-    ("IGNORE", r"/\*.*\*/|(?://|#).*$|[ \t]+"),
-    ("NEWLINE", r"\n"),
-    ("KEYWORD", "|".join(Keyword)),
-    ("LITERAL", r'-?[0-9]+(?:\.[0-9]+)?|".*?"|TRUE|FALSE'),
-    ("SYMBOL", r"(" + "|".join(map(re.escape, Symbol)) + ")"),
-    ("IDENTIFIER", r"[A-Za-z][A-Za-z0-9]*"),
-    ("INVALID", r"."),
-    ("EOF", r"$"),
-]
-_TOKEN_REGEX = "|".join(f"(?P<{name}>{regex})" for name, regex in _TOKENS)
-
-
-def _parse_literal(literal: str) -> Value:
-    if literal.startswith('"') and literal.endswith('"'):
-        return literal[1:-1]
-    if literal == "TRUE":
-        return Value(True)
-    if literal == "FALSE":
-        return Value(False)
-    try:
-        if "." in literal:
-            return float(literal)
-        else:
-            return int(literal)
-    except ValueError:
-        raise ValueError("Invalid literal")
 
+# Classes of the first character of a token
+_SPACE, _NEWLINE, _NAME, _NUMBER, _STRING, _SYMBOL, _SLASH, _HASH = range(8)
 
-def _parse_token(token_string: str, token_type: str, **token_kwargs) -> Token:
-    if token_type == "KEYWORD":
-        return KeywordToken(keyword=Keyword(token_string), **token_kwargs)
-    elif token_type == "IDENTIFIER":
-        return IdentifierToken(value=token_string, **token_kwargs)
-    elif token_type == "SYMBOL":
-        return SymbolToken(symbol=Symbol(token_string), **token_kwargs)
-    elif token_type == "EOF":
-        return EOFToken(**token_kwargs)
-    else:
-        value = _parse_literal(token_string)
-        return LiteralToken(value=value, **token_kwargs)
+_CHAR_KINDS: dict[str, int] = {" ": _SPACE, "\t": _SPACE, "\r": _SPACE, "\n": _NEWLINE}
+_CHAR_KINDS.update(dict.fromkeys(string.ascii_letters, _NAME))
+_CHAR_KINDS.update(dict.fromkeys(string.digits, _NUMBER))
+_CHAR_KINDS.update({symbol.value: _SYMBOL for symbol in Symbol if len(symbol) == 1})
+_CHAR_KINDS.update({'"': _STRING, "/": _SLASH, "#": _HASH})
+
+_KEYWORDS: dict[str, Keyword] = {
+    keyword.value: keyword for keyword in Keyword if keyword != Keyword.CASE_OF
+}
+_BOOLEANS = {"TRUE": True, "FALSE": False}
+_SYMBOLS: dict[str, Symbol] = {symbol.value: symbol for symbol in Symbol}
+
+_SPACES = re.compile(r"[ \t\r]*")
+_NAME_REST = re.compile(r"[A-Za-z0-9]*")
+_NUMBER_LITERAL = re.compile(r"[0-9]+(\.[0-9]+)?")
+_CASE_OF = re.compile(r"[ \t]+OF(?![A-Za-z0-9])")
 
 
 def parse_tokens(code: str) -> list[Token]:
@@ -172,39 +252,134 @@ def parse_tokens(code: str) -> list[Token]:
     :rtype: list[Token]
     """
     res: list[Token] = []
-    origin = code.splitlines()
-    line_number: int = 1
-    line_start: int = 0
-    for match in re.finditer(_TOKEN_REGEX, code, re.M):
-        token_type = match.lastgroup
-        if token_type is None:
-            raise ValueError("An error occurred")
-        token_value = str(match.group())
-        token_start = match.start()
-        if token_type == "IGNORE":
-            continue
-        elif token_type == "NEWLINE":
-            line_number += 1
-            line_start = token_start
-            continue
-        elif token_type == "INVALID":
-            raise InvalidTokenError(
-                f"Invalid token '{token_value}' at line {line_number}, column {token_start - line_start}",
-                origin,
-                line_number,
-            )
+    line_number, line_start = _scan(code, res, 1, 0)
+    res.append(EOFToken(line_number, len(code) - line_start))
+    return res
 
-        try:
-            token = _parse_token(
-                token_value,
-                token_type,
-                line=line_number,
-                column=token_start - line_start,
-            )
-        except ValueError:
-            raise InvalidTokenError(
-                f"Invalid literal {token_value}", origin, line_number
-            )
 
-        res.append(token)
-    return res
+def iter_tokens(
+    source: str | TextIO | BinaryIO | mmap.mmap, chunk_size: int = 1 << 16
+) -> Iterator[Token]:
+    """
+    Lazily parse tokens from a program, reading it a chunk at a time.
+    Tokens never span lines, so each chunk is lexed up to its last newline and
+    the rest is carried over to the next one.
+    :param source: program to parse, or a file object or mmap to read it from.
+        Binary sources are decoded as UTF-8.
+    :param chunk_size: number of characters (or bytes) to read at a time.
+    :return: an iterator over the tokens in the program, ending with EOF.
+    """
+    if isinstance(source, str):
+        source = io.StringIO(source)
+    line_number = 1
+    line_start = 0
+    chunk = source.read(chunk_size)
+    pending = chunk[:0]
+    while chunk:
+        pending += chunk
+        cut = pending.rfind(b"\n" if isinstance(pending, bytes) else "\n") + 1
+        if cut:
+            lines = pending[:cut]
+            pending = pending[cut:]
+            if isinstance(lines, bytes):
+                lines = lines.decode()
+            tokens: list[Token] = []
+            line_number, _ = _scan(lines, tokens, line_number, line_start)
+            # Later chunks start just after a newline
+            line_start = -1
+            yield from tokens
+        chunk = source.read(chunk_size)
+    if isinstance(pending, bytes):
+        pending = pending.decode()
+    tokens = []
+    _scan(pending, tokens, line_number, line_start)
+    yield from tokens
+    yield EOFToken(line_number, len(pending) - line_start)
+
+
+def _scan(
+    code: str,
+    res: list[Token],
+    line_number: int,
+    line_start: int,
+) -> tuple[int, int]:
+    # Appends the tokens in code, which starts at the given line, to res.
+    # Columns are counted from line_start. Returns the line number and
+    # line_start at the end.
+    append = res.append
+    char_kinds = _CHAR_KINDS
+    first_line = line_number
+    index = 0
+    end = len(code)
+    while index < end:
+        char = code[index]
+        kind = char_kinds.get(char)
+        column = index - line_start
+
+        if kind == _NAME:
+            name_end = _NAME_REST.match(code, index + 1).end()
+            name = code[index:name_end]
+            keyword = _KEYWORDS.get(name)
+            if keyword is not None:
+                append(KeywordToken(line_number, column, keyword))
+            elif name in _BOOLEANS:
+                append(LiteralToken(line_number, column, _BOOLEANS[name]))
+            elif name == "CASE" and (match := _CASE_OF.match(code, name_end)):
+                append(KeywordToken(line_number, column, Keyword.CASE_OF))
+                name_end = match.end()
+            else:
+                append(IdentifierToken(line_number, column, name))
+            index = name_end
+        elif kind == _SPACE:
+            index = _SPACES.match(code, index + 1).end()
+        elif kind == _SYMBOL:
+            pair = code[index : index + 2]
+            if pair in _SYMBOLS:
+                append(SymbolToken(line_number, column, _SYMBOLS[pair]))
+                index += 2
+            else:
+                append(SymbolToken(line_number, column, _SYMBOLS[char]))
+                index += 1
+        elif kind == _NEWLINE:
+            line_number += 1
+            line_start = index
+            index += 1
+        elif kind == _NUMBER:
+            # Signs are left to the parser, so "-2 ^ 2" is -(2 ^ 2)
+            match = _NUMBER_LITERAL.match(code, index)
+            literal = code[index : match.end()]
+            value = float(literal) if match.group(1) else int(literal)
+            append(LiteralToken(line_number, column, value))
+            index = match.end()
+        elif kind == _STRING:
+            close = code.find('"', index + 1)
+            if close == -1 or "\n" in code[index + 1 : close]:
+                _invalid_token(code, first_line, char, line_number, column)
+            append(LiteralToken(line_number, column, code[index + 1 : close]))
+            index = close + 1
+        elif kind == _HASH or code.startswith("//", index):
+            index = code.find("\n", index)
+            if index == -1:
+                index = end
+        elif kind == _SLASH:
+            line_end = code.find("\n", index)
+            close = code.find("*/", index + 2, end if line_end == -1 else line_end)
+            if code.startswith("/*", index) and close != -1:
+                # Block comments can't span lines
+                index = close + 2
+            else:
+                append(SymbolToken(line_number, column, Symbol.DIV))
+                index += 1
+        else:
+            _invalid_token(code, first_line, char, line_number, column)
+    return line_number, line_start
+
+
+def _invalid_token(code: str, first_line: int, token: str, line: int, column: int):
+    # The source lines are only needed for the error message. Lines before
+    # code (when lexing a chunk of a stream) are left blank.
+    raise InvalidTokenError(
+        f"Invalid token '{token}' at line {line}, column {column}",
+        [""] * (first_line - 1) + code.splitlines(),
+        line,
+    )
@@ -5,7 +5,8 @@ __all__ = [
     "Parser",
 ]
 
-from typing import Callable, TypeVar
+from itertools import islice
+from typing import Callable, Iterable, Iterator, TypeVar
 
 from cambridgeScript.constants import Keyword, Symbol, Operator
 from cambridgeScript.syntax_tree import (
@@ -51,7 +52,6 @@ from cambridgeScript.parser.lexer import (
     LiteralToken,
     KeywordToken,
     IdentifierToken,
-    Value,
     EOFToken,
     EOF,
 )
@@ -69,91 +69,166 @@ class _InvalidMatch(Exception):
         pass
 
 
+# Number of tokens read from a stream at a time
+_BATCH_SIZE = 256
+
+
 class Parser:
+    """
+    Turns tokens into a syntax tree.
+
+    A Parser holds all the state of one parse (including the source shown in
+    error messages), so it's used for one parse and then dropped. The lexer
+    and the classmethods below keep no shared state, so different threads can
+    parse different programs at the same time. A single Parser instance isn't
+    safe to use from several threads at once.
+    """
+
     tokens: list[Token]
     _next_index: int
+    # Tokens not read yet, None once they have all been read
+    _stream: Iterator[Token] | None
+    _source: str
+    _origin: list[str] | None
 
-    def __init__(self, tokens: list[Token]):
-        self.tokens = tokens
+    def __init__(self, tokens: Iterable[Token], origin: str = ""):
+        """
+        :param tokens: tokens to parse. If this isn't a list, tokens are read
+            from it as they're needed, and the ones already parsed are dropped.
+        :param origin: source code of the tokens, shown in error messages
+        """
+        if isinstance(tokens, list):
+            self.tokens = tokens
+            self._stream = None
+        else:
+            self.tokens = []
+            self._stream = iter(tokens)
         self._next_index = 0
+        self._source = origin
+        self._origin = None
+        # Whether a CASE arm's label may start any line, while parsing the
+        # value of a CASE or the statements directly in one of its arms
+        self._label_ahead = False
+
+    @property
+    def origin(self) -> list[str]:
+        # Lines of the source, only split once an error needs them
+        if self._origin is None:
+            self._origin = self._source.splitlines()
+        return self._origin
 
     @classmethod
-    def parse_expression(cls, tokens: list[Token]) -> Expression:
+    def parse_expression(cls, tokens: Iterable[Token], origin: str = "") -> Expression:
         """
         Parses a list of tokens as an expression
         :param tokens: tokens to parse
+        :param origin: source code of the tokens, shown in error messages
         :return: an Expression
         """
-        instance = cls(tokens)
+        instance = cls(tokens, origin)
         result = instance._expression()
-        if not instance._is_at_end():
-            next_token = instance._peek()
-            raise ParserError(
-                f"Extra token {next_token} found", cls.origin, next_token.line
-            )
+        instance._end()
         return result
 
     @classmethod
-    def parse_statement(cls, tokens: list[Token]) -> Statement:
+    def parse_statement(cls, tokens: Iterable[Token], origin: str = "") -> Statement:
         """
         Parses a list of tokens as a single statement
         :param tokens: tokens to parse
+        :param origin: source code of the tokens, shown in error messages
         :return: a Statement
         """
-        instance = cls(tokens)
+        instance = cls(tokens, origin)
         result = instance._statement()
-        if not instance._is_at_end():
-            next_token = instance._peek()
-            raise ParserError(
-                f"Extra token {next_token} found", cls.origin, next_token.line
-            )
+        instance._end()
         return result
 
     @classmethod
-    def parse_program(cls, tokens: list[Token], origin) -> Program:
+    def parse_program(cls, tokens: Iterable[Token], origin: str = "") -> Program:
         """
         Parses a list of tokens as a program (series of statements)
-        :param tokens: tokens to parse
+        :param tokens: tokens to parse, e.g. from parse_tokens() or
+            iter_tokens()
+        :param origin: source code of the program, shown in error messages
         :return: list of Statemnets
         """
-        cls.origin = origin.splitlines()
-        statements = cls(tokens)._statements_until(EOF)
+        statements = cls(tokens, origin)._statements_until(EOF)
         return Program(statements)
 
     # Helpers
 
+    def _fill(self, count: int) -> None:
+        # Reads tokens from the stream until `count` are buffered from the
+        # next one (or the stream runs out)
+        if self._stream is None:
+            return
+        # The parser never goes back, so tokens before the next one are done.
+        # The last one is kept for _starts_line.
+        done = max(self._next_index - 1, 0)
+        del self.tokens[:done]
+        self._next_index -= done
+        missing = self._next_index + count - len(self.tokens)
+        if missing > 0:
+            read = list(islice(self._stream, max(missing, _BATCH_SIZE)))
+            if len(read) < missing:
+                self._stream = None
+            self.tokens.extend(read)
+
+    def _end(self) -> None:
+        # Raises an error if there are tokens left
+        if not self._is_at_end():
+            next_token = self._peek()
+            raise ParserError(
+                f"Extra token {next_token} found", self.origin, next_token.line
+            )
+
     def _peek(self) -> Token:
         # Returns the next token without consuming
-        return self.tokens[self._next_index]
+        try:
+            return self.tokens[self._next_index]
+        except IndexError:
+            self._fill(1)
+            return self.tokens[self._next_index]
 
     def _peek_ahead(self, offset: int = 1) -> Token:
+        if self._next_index + offset >= len(self.tokens):
+            self._fill(offset + 1)
         target_index = self._next_index + offset
         if target_index < len(self.tokens):
             return self.tokens[target_index]
         return EOF  # Return EOF if out of bounds
 
+    def _starts_line(self, token: Token) -> bool:
+        # Whether token, the next one, is the first on its line
+        return (
+            self._next_index > 0
+            and self.tokens[self._next_index - 1].line != token.line
+        )
+
     def _is_at_end(self) -> bool:
         # Returns whether the pointer is at the end
-        return self._peek() == EOF
+        return self._peek().kind is EOF
 
     def _advance(self) -> Token:
         # Consumes and returns the next token
         res = self._peek()
-        if not self._is_at_end():
+        if res.kind is not EOF:
             self._next_index += 1
         return res
 
     def _check(self, *targets: TokenComparable) -> Token | None:
-        # Return the token if the next token matches
+        # Return the token if the next token matches. Targets are enum
+        # members (or EOF), so they're found by identity.
         next_token = self._peek()
-        return next_token if next_token in targets else None
+        return next_token if next_token.kind in targets else None
 
     def _match(self, *targets: TokenComparable) -> Token | None:
         # Consume and return the token if the next token matches
-        res = self._check(*targets)
-        if res:
+        next_token = self._peek()
+        if next_token.kind in targets:
             self._advance()
-        return res
+            return next_token
+        return None
 
     def _consume(self, target: TokenComparable) -> Token:
         # Attempt to match a token, and raise an error if it fails
@@ -267,67 +342,23 @@ class Parser:
         self, *tokens: TokenComparable, consume_end: bool = True
     ) -> list[Statement]:
         result = []
+        # Blocks nested in a CASE arm end with their own keyword, not a label
+        label_ahead, self._label_ahead = self._label_ahead, False
         while not self._check(*tokens):
             result.append(self._statement())
+        self._label_ahead = label_ahead
         if consume_end:
             self._advance()
         return result
 
-    def _binary_op(
-        self,
-        operand_getter: Callable[[], Expression],
-        operator_mapping: dict[TokenComparable, Callable[[Value, Value], Value]],
-    ) -> Expression:
-        left = operand_getter()
-        while op_token := self._match(*operator_mapping):
-            op = operator_mapping[op_token]
-            right = operand_getter()
-            left = BinaryOp(
-                operator=op,
-                left=left,
-                right=right,
-            )
-        return left
-
     # Statements
 
     def _statement(self) -> Statement:
-        if self._check(Keyword.PROCEDURE):
-            return self._procedure_decl()
-        elif self._check(Keyword.FUNCTION):
-            return self._function_decl()
-        elif self._check(Keyword.IF):
-            return self._if_stmt()
-        elif self._check(Keyword.CASE_OF):
-            return self._case_stmt()
-        elif self._check(Keyword.FOR):
-            return self._for_loop()
-        elif self._check(Keyword.REPEAT):
-            return self._repeat_loop()
-        elif self._check(Keyword.WHILE):
-            return self._while_loop()
-        elif self._check(Keyword.DECLARE):
-            return self._declare_variable()
-        elif self._check(Keyword.CONSTANT):
-            return self._declare_constant()
-        elif self._check(Keyword.INPUT):
-            return self._input()
-        elif self._check(Keyword.OUTPUT):
-            return self._output()
-        elif self._check(Keyword.RETURN):
-            return self._return()
-        elif self._check(Keyword.OPENFILE):
-            return self._file_open()
-        elif self._check(Keyword.READFILE):
-            return self._file_read()
-        elif self._check(Keyword.WRITEFILE):
-            return self._file_write()
-        elif self._check(Keyword.CLOSEFILE):
-            return self._file_close()
-        elif self._check(Keyword.CALL):
-            return self._procedure_call()
-        else:
+        next_token = self._peek()
+        rule = _STATEMENT_RULES.get(next_token.kind)
+        if rule is None:
             return self._assignment()
+        return rule(self)
 
     def _procedure_decl(self) -> ProcedureDecl:
         self._consume_first(Keyword.PROCEDURE)
@@ -359,32 +390,53 @@ class Parser:
 
     def _case_stmt(self) -> CaseStmt:
         self._consume_first(Keyword.CASE_OF)
+        label_ahead, self._label_ahead = self._label_ahead, True
         identifier = self._expression()
-        cases: list[Expression] = []
-        bodies: list[list[Statement]] = []
+        self._label_ahead = label_ahead
+        cases: list[tuple[Expression, list[Statement]]] = []
         otherwise = None
+        # Label of the next arm, if it was parsed while looking for the end of
+        # the previous arm's body
+        label = None
         while True:
-            body = []
-            if self._check(Keyword.OTHERWISE):
-                self._advance()
-                self._consume(Symbol.COLON)
-                otherwise = self._statements_until(Keyword.ENDCASE)
+            if label is None:
+                if self._match(Keyword.OTHERWISE):
+                    self._consume(Symbol.COLON)
+                    otherwise = self._statements_until(Keyword.ENDCASE)
+                    break
+                if self._match(Keyword.ENDCASE):
+                    break
+                label = self._expression()
+            self._consume(Symbol.COLON)
+            body, next_label = self._case_body()
+            cases.append((label, body))
+            label = next_label
+        return CaseStmt(identifier, cases, otherwise)
+
+    def _case_body(self) -> tuple[list[Statement], Expression | None]:
+        # Statements of a CASE arm, up to OTHERWISE, ENDCASE or the next arm.
+        # A statement that doesn't start with a keyword is either an
+        # assignment or the label of the next arm, so its first expression is
+        # parsed and the token after it (":" or "<-") tells them apart.
+        # Returns the body and the label of the next arm if one was found.
+        body: list[Statement] = []
+        next_label = None
+        label_ahead, self._label_ahead = self._label_ahead, True
+        while True:
+            kind = self._peek().kind
+            if kind is Keyword.OTHERWISE or kind is Keyword.ENDCASE or kind is EOF:
                 break
-            if self._check(Keyword.ENDCASE):
-                self._advance()
+            rule = _STATEMENT_RULES.get(kind)
+            if rule is not None:
+                body.append(rule(self))
+                continue
+            expression = self._expression()
+            if self._check(Symbol.COLON):
+                next_label = expression
                 break
-            case = self._expression()
-            self._consume(Symbol.COLON)
-            while True:
-                index = self._next_index
-                try:
-                    body.append(self._statement())
-                except:
-                    self._next_index = index
-                    break
-            cases.append(case)
-            bodies.append(body)
-        return CaseStmt(identifier, list(zip(cases, bodies)), otherwise)
+            body.append(self._assignment(expression))
+        self._label_ahead = label_ahead
+        return body, next_label
 
     def _for_loop(self) -> ForStmt:
         self._consume_first(Keyword.FOR)
@@ -449,7 +501,15 @@ class Parser:
         self._consume_first(Keyword.CONSTANT)
         name: IdentifierToken = self._consume_type(IdentifierToken)  # type: ignore
         self._consume(Symbol.ASSIGN)
+        sign = self._match(Symbol.SUB)
         value: LiteralToken = self._consume_type(LiteralToken)  # type: ignore
+        if sign is not None:
+            # The lexer leaves signs to the parser, but constants are literals
+            if value.value.__class__ not in (int, float):
+                raise ParserError(
+                    f"Expected a number after -, got {value}", self.origin, value.line
+                )
+            value = LiteralToken(sign.line, sign.column, -value.value)
         return ConstantDecl(name, value)
 
     def _input(self) -> InputStmt:
@@ -507,79 +567,66 @@ class Parser:
             arg_list = None
         return ProcedureCallStmt(name, arg_list)
 
-    def _assignment(self) -> AssignmentStmt:
-        target = self._assignable()
+    def _assignment(self, target: Expression | None = None) -> AssignmentStmt:
+        # The target may have been parsed already (see _case_body)
+        if target is None:
+            target = self._assignable()
+        else:
+            self._check_assignable(target)
         self._consume(Symbol.ASSIGN)
         value = self._expression()
         return AssignmentStmt(target, value)
 
     # Expressions
 
-    def _expression(self) -> Expression:
-        return self._logic_or()
+    def _expression(self, min_power: int = 0) -> Expression:
+        # Precedence climbing: keeps taking infix operators that bind at least
+        # as tightly as min_power, parsing each right operand with the power
+        # the operator gives it
+        left = self._unary()
+        while True:
+            next_token = self._peek()
+            infix = _INFIX_OPERATORS.get(next_token.kind)
+            if infix is None or infix[0] < min_power:
+                return left
+            if (
+                next_token.kind is Symbol.SUB
+                and self._label_ahead
+                and self._starts_line(next_token)
+            ):
+                # A line starting with "-" is the next arm's negative label,
+                # it doesn't subtract from the line before
+                return left
+            self._advance()
+            _, right_power, operator = infix
+            left = BinaryOp(
+                operator=operator,
+                left=left,
+                right=self._expression(right_power),
+            )
 
     def _assignable(self) -> Assignable:
         result = self._call()
-        if not isinstance(result, (ArrayIndex, Identifier)):
+        self._check_assignable(result)
+        return result
+
+    def _check_assignable(self, expression: Expression) -> None:
+        if not isinstance(expression, (ArrayIndex, Identifier)):
             raise ParserError(
-                f"Expected identifier or array index, get {result}",
+                f"Expected identifier or array index, get {expression}",
                 self.origin,
                 self._peek().line,
             )
-        return result
-
-    def _logic_or(self) -> Expression:
-        return self._binary_op(self._logic_and, {Keyword.OR: Operator.OR})
-
-    def _logic_and(self) -> Expression:
-        left = self._logic_not()
-        while self._match(Keyword.AND):
-            right = self._logic_not()
-            left = BinaryOp(
-                operator=Operator.AND,
-                left=left,
-                right=right,
-            )
-        return left
-
-    def _logic_not(self) -> Expression:
-        if not self._match(Keyword.NOT):
-            return self._comparison()
-        return UnaryOp(Operator.NOT, self._logic_not())
-
-    def _comparison(self) -> Expression:
-        return self._binary_op(
-            self._term,
-            {
-                Symbol.EQUAL: Operator.EQUAL,
-                Symbol.NOT_EQUAL: Operator.NOT_EQUAL,
-                Symbol.LESS_EQUAL: Operator.LESS_EQUAL,
-                Symbol.GREAT_EQUAL: Operator.GREAT_EQUAL,
-                Symbol.LESS: Operator.LESS_THAN,
-                Symbol.GREAT: Operator.GREATER_THAN,
-            },
-        )
-
-    def _term(self) -> Expression:
-        return self._binary_op(
-            self._factor,
-            {
-                Symbol.ADD: Operator.ADD,
-                Symbol.SUB: Operator.SUB,
-                Symbol.CONCAT: Operator.CONCAT,
-            },
-        )
 
-    def _factor(self) -> Expression:
-        return self._binary_op(
-            self._call,
-            {
-                Symbol.MUL: Operator.MUL,
-                Symbol.DIV: Operator.DIV,
-                # Symbol.DDIV: Operator.DDIV,
-                # Symbol.MOD: Operator.MOD,
-            },
-        )
+    def _unary(self) -> Expression:
+        kind = self._peek().kind
+        if kind is Symbol.SUB:
+            self._advance()
+            return UnaryOp(Operator.UNARY_SUB, self._expression(_POWER))
+        if kind is Keyword.NOT:
+            self._advance()
+            return UnaryOp(Operator.NOT, self._expression(_COMPARISON))
+        return self._call()
 
     def _call(self) -> Expression:
         left = self._primary()
@@ -600,25 +647,75 @@ class Parser:
         return left
 
     def _primary(self) -> Expression:
-        if self._match(Symbol.LPAREN):
-            res = self._expression()
-            self._consume(Symbol.RPAREN)
-            return res
         next_token = self._peek()
-        if isinstance(next_token, LiteralToken):
-            self._advance()
+        if next_token.__class__ is LiteralToken:
+            self._next_index += 1
             return Literal(next_token)
-        elif isinstance(next_token, IdentifierToken):
-            self._advance()
+        elif next_token.__class__ is IdentifierToken:
+            self._next_index += 1
             return Identifier(next_token)
-        elif isinstance(next_token, SymbolToken) and next_token.symbol == Symbol.SUB:
-            # Handle unary minus
+        elif next_token.kind is Symbol.LPAREN:
+            self._next_index += 1
+            res = self._expression()
+            self._consume(Symbol.RPAREN)
+            return res
+        elif next_token.kind is Keyword.MOD or next_token.kind is Keyword.DIV:
+            # The MOD(a, b) and DIV(a, b) builtins
             self._advance()
-            operand = self._primary()
-            return UnaryOp(Operator.SUB, operand)
+            name = IdentifierToken(
+                next_token.line, next_token.column, next_token.kind.value
+            )
+            return Identifier(name)
         else:
             raise ParserError(
                 f"Expected expression, found {next_token} instead",
                 self.origin,
                 next_token.line,
             )
+
+
+# Binding powers of infix operators, from loosest to tightest
+_OR, _AND, _COMPARISON, _TERM, _FACTOR, _POWER = range(1, 7)
+
+# Binding power, binding power of the right operand, and function of each
+# infix operator. All of them are left associative except ^
+_INFIX_OPERATORS: dict[TokenComparable, tuple[int, int, Callable]] = {
+    Keyword.OR: (_OR, _OR + 1, Operator.OR),
+    Keyword.AND: (_AND, _AND + 1, Operator.AND),
+    Symbol.EQUAL: (_COMPARISON, _COMPARISON + 1, Operator.EQUAL),
+    Symbol.NOT_EQUAL: (_COMPARISON, _COMPARISON + 1, Operator.NOT_EQUAL),
+    Symbol.LESS_EQUAL: (_COMPARISON, _COMPARISON + 1, Operator.LESS_EQUAL),
+    Symbol.GREAT_EQUAL: (_COMPARISON, _COMPARISON + 1, Operator.GREAT_EQUAL),
+    Symbol.LESS: (_COMPARISON, _COMPARISON + 1, Operator.LESS_THAN),
+    Symbol.GREAT: (_COMPARISON, _COMPARISON + 1, Operator.GREATER_THAN),
+    Symbol.ADD: (_TERM, _TERM + 1, Operator.ADD),
+    Symbol.SUB: (_TERM, _TERM + 1, Operator.SUB),
+    Symbol.CONCAT: (_TERM, _TERM + 1, Operator.CONCAT),
+    Symbol.MUL: (_FACTOR, _FACTOR + 1, Operator.MUL),
+    Symbol.DIV: (_FACTOR, _FACTOR + 1, Operator.DIV),
+    Keyword.DIV: (_FACTOR, _FACTOR + 1, Operator.DDIV),
+    Keyword.MOD: (_FACTOR, _FACTOR + 1, Operator.MOD),
+    Symbol.POW: (_POWER, _POWER, Operator.POW),
+}
+
+# Rule for each statement that starts with a keyword, anything else is an
+# assignment
+_STATEMENT_RULES: dict[Keyword, Callable[[Parser], Statement]] = {
+    Keyword.PROCEDURE: Parser._procedure_decl,
+    Keyword.FUNCTION: Parser._function_decl,
+    Keyword.IF: Parser._if_stmt,
+    Keyword.CASE_OF: Parser._case_stmt,
+    Keyword.FOR: Parser._for_loop,
+    Keyword.REPEAT: Parser._repeat_loop,
+    Keyword.WHILE: Parser._while_loop,
+    Keyword.DECLARE: Parser._declare_variable,
+    Keyword.CONSTANT: Parser._declare_constant,
+    Keyword.INPUT: Parser._input,
+    Keyword.OUTPUT: Parser._output,
+    Keyword.RETURN: Parser._return,
+    Keyword.OPENFILE: Parser._file_open,
+    Keyword.READFILE: Parser._file_read,
+    Keyword.WRITEFILE: Parser._file_write,
+    Keyword.CLOSEFILE: Parser._file_close,
+    Keyword.CALL: Parser._procedure_call,
+}
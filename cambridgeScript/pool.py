@@ -0,0 +1,246 @@
+__all__ = [
+    "Job",
+    "JobResult",
+    "WorkerPool",
+]
+
+import os
+import signal
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field, asdict
+from functools import lru_cache
+from typing import Any, Iterable, Iterator
+
+from cambridgeScript.batch import BatchRunner, CaseResult
+from cambridgeScript.interpreter.budget import Budget
+from cambridgeScript.parser.cache import DiskCache
+from cambridgeScript.vm.machine import DEFAULT_MAX_DEPTH
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+
+@dataclass
+class Job:
+    """A program and the inputs to run it against."""
+
+    source: str
+    # (name, stdin, expected output or None) of each case
+    cases: list[tuple[str, str, str | None]]
+    id: Any = None
+    # Limits for this job, None to use the pool's
+    timeout: float | None = None
+    memory_limit: int | None = None
+    budget: Budget | None = None
+
+
+@dataclass
+class JobResult:
+    """
+    Outcome of a job.
+
+    status is "ok" if every case ran, "timeout" or "memory" if the job hit
+    a limit, and "error" if it couldn't run at all (e.g. the program doesn't
+    parse, or its worker died). Errors raised by the program itself are
+    reported in the cases.
+    """
+
+    id: Any
+    status: str
+    cases: list[CaseResult] = field(default_factory=list)
+    error: str | None = None
+    # Seconds spent on the job in the worker, including parsing
+    time: float = 0.0
+
+    def to_dict(self) -> dict[str, Any]:
+        return asdict(self)
+
+
+class _Timeout(BaseException):
+    # Not an Exception, so BatchRunner doesn't report it as a program error
+    pass
+
+
+def _alarm(signum, frame):
+    raise _Timeout
+
+
+def _disarm(use_alarm: bool) -> None:
+    # Cancel the job's alarm if it has one
+    if use_alarm:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+@lru_cache(maxsize=64)
+def _runner(
+    source: str,
+    engine: str,
+    optimize: bool,
+    cache_dir: str | None,
+    max_depth: int,
+    limits: tuple[int | None, float | None, int | None] | None,
+) -> BatchRunner:
+    # Each worker keeps the programs it has parsed recently. The budget is
+    # passed as its limits, since every job gets its own unpickled Budget.
+    cache = DiskCache(cache_dir) if cache_dir is not None else None
+    budget = Budget(*limits) if limits is not None else None
+    return BatchRunner(source, engine, optimize, cache, max_depth, budget=budget)
+
+
+def _run_job(
+    job: Job,
+    engine: str,
+    optimize: bool,
+    cache_dir: str | None,
+    timeout: float | None,
+    memory_limit: int | None,
+    max_depth: int,
+    budget: Budget | None,
+) -> JobResult:
+    # Runs in a worker process
+    result = JobResult(job.id, "ok")
+    start = time.perf_counter()
+
+    use_alarm = timeout is not None and hasattr(signal, "setitimer")
+    if use_alarm:
+        previous_handler = signal.signal(signal.SIGALRM, _alarm)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    if memory_limit is not None and resource is not None:
+        previous_limit = resource.getrlimit(resource.RLIMIT_AS)
+        resource.setrlimit(resource.RLIMIT_AS, (memory_limit, previous_limit[1]))
+    else:
+        previous_limit = None
+
+    if budget is not None:
+        limits = (budget.max_statements, budget.max_time, budget.max_cells)
+    else:
+        limits = None
+
+    case_start = start
+    try:
+        runner = _runner(job.source, engine, optimize, cache_dir, max_depth, limits)
+        for name, stdin, expected in job.cases:
+            case_start = time.perf_counter()
+            case = runner.run_case(name, stdin, expected)
+            result.cases.append(case)
+            if case.error is not None and case.error.startswith("MemoryError"):
+                result.status = "memory"
+                break
+        # Disarmed before leaving the try, so the alarm can't go off where
+        # nothing catches it
+        _disarm(use_alarm)
+    except _Timeout:
+        _disarm(use_alarm)
+        result.status = "timeout"
+        if len(result.cases) < len(job.cases):
+            name = job.cases[len(result.cases)][0]
+            elapsed = time.perf_counter() - case_start
+            result.cases.append(CaseResult(name, "", "Timeout", elapsed, False))
+    except MemoryError:
+        _disarm(use_alarm)
+        result.status = "memory"
+    except Exception as e:
+        _disarm(use_alarm)
+        result.status = "error"
+        result.error = f"{type(e).__name__}: {e}"
+    finally:
+        # In case anything else (e.g. KeyboardInterrupt) got through
+        _disarm(use_alarm)
+        if use_alarm:
+            signal.signal(signal.SIGALRM, previous_handler)
+        if previous_limit is not None:
+            resource.setrlimit(resource.RLIMIT_AS, previous_limit)
+
+    result.time = time.perf_counter() - start
+    return result
+
+
+class WorkerPool:
+    """
+    Runs jobs in parallel across worker processes.
+
+    Workers are started once and reused, so they keep their imported modules
+    and the programs they have already parsed. Timeouts and memory limits are
+    enforced inside the worker (with SIGALRM and RLIMIT_AS) and are ignored
+    on platforms that don't support them.
+    """
+
+    def __init__(
+        self,
+        workers: int | None = None,
+        engine: str = "tree",
+        optimize: bool = True,
+        cache_dir: str | os.PathLike | None = None,
+        timeout: float | None = None,
+        memory_limit: int | None = None,
+        max_depth: int = DEFAULT_MAX_DEPTH,
+        budget: Budget | None = None,
+    ):
+        """
+        :param workers: number of processes, defaults to the number of CPUs
+        :param engine: "tree", "closure" or "vm", as for the run command
+        :param optimize: whether to fold constant expressions
+        :param cache_dir: directory of an on-disk parse cache shared by the
+            workers, if any
+        :param timeout: default time limit of a job in seconds
+        :param memory_limit: default limit of a worker's address space in
+            bytes while it runs a job
+        :param max_depth: maximum depth of subroutine calls
+        :param budget: default limits every case of a job runs under
+        """
+        self.engine = engine
+        self.optimize = optimize
+        self.cache_dir = os.fspath(cache_dir) if cache_dir is not None else None
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self.max_depth = max_depth
+        self.budget = budget
+        self._executor = ProcessPoolExecutor(workers)
+
+    def submit(self, job: Job) -> "Future[JobResult]":
+        """
+        Schedules a job
+        :param job: job to run
+        :return: a Future of the job's result
+        """
+        return self._executor.submit(
+            _run_job,
+            job,
+            self.engine,
+            self.optimize,
+            self.cache_dir,
+            job.timeout if job.timeout is not None else self.timeout,
+            job.memory_limit if job.memory_limit is not None else self.memory_limit,
+            self.max_depth,
+            job.budget if job.budget is not None else self.budget,
+        )
+
+    def map(self, jobs: Iterable[Job]) -> Iterator[JobResult]:
+        """
+        Runs jobs in parallel
+        :param jobs: jobs to run
+        :return: an iterator over the results, in the same order as jobs
+        """
+        submitted = [(job, self.submit(job)) for job in jobs]
+        for job, future in submitted:
+            try:
+                yield future.result()
+            except BrokenProcessPool as e:
+                # A worker died (e.g. killed by the OS), so did the pool
+                yield JobResult(job.id, "error", error=f"Worker died: {e}")
+            except (Exception, _Timeout) as e:
+                # Anything else that escaped the worker only fails this job
+                yield JobResult(job.id, "error", error=f"{type(e).__name__}: {e}")
+
+    def close(self) -> None:
+        self._executor.shutdown()
+
+    def __enter__(self) -> "WorkerPool":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
@@ -25,7 +25,7 @@ class Expression(ABC):
         pass
 
 
-@dataclass
+@dataclass(frozen=True)
 class BinaryOp(Expression):
     operator: Callable[[Value, Value], Value]
     left: Expression
@@ -35,7 +35,7 @@ class BinaryOp(Expression):
         return visitor.visit_binary_op(self)
 
 
-@dataclass
+@dataclass(frozen=True)
 class UnaryOp(Expression):
     operator: Callable[[Value], Value]
     operand: Expression
@@ -44,7 +44,7 @@ class UnaryOp(Expression):
         return visitor.visit_unary_op(self)
 
 
-@dataclass
+@dataclass(frozen=True)
 class FunctionCall(Expression):
     function: Expression
     params: list[Expression]
@@ -53,7 +53,7 @@ class FunctionCall(Expression):
         return visitor.visit_function_call(self)
 
 
-@dataclass
+@dataclass(frozen=True)
 class ArrayIndex(Expression):
     array: Expression
     index: list[Expression]
@@ -62,7 +62,7 @@ class ArrayIndex(Expression):
         return visitor.visit_array_index(self)
 
 
-@dataclass
+@dataclass(frozen=True)
 class Literal(Expression):
     token: LiteralToken
 
@@ -70,7 +70,7 @@ class Literal(Expression):
         return visitor.visit_literal(self)
 
 
-@dataclass
+@dataclass(frozen=True)
 class Identifier(Expression):
     token: IdentifierToken
 
@@ -20,16 +20,22 @@ __all__ = [
     "AssignmentStmt",
     # "ExprStmt",
     "Program",
+    "first_line",
 ]
 
 from abc import ABC, abstractmethod
-from dataclasses import dataclass
+from dataclasses import dataclass, fields
 from typing import Any, TYPE_CHECKING
 
 if TYPE_CHECKING:
     from cambridgeScript.syntax_tree.visitors import StatementVisitor
 
-from cambridgeScript.parser.lexer import IdentifierToken, LiteralToken, KeywordToken
+from cambridgeScript.parser.lexer import (
+    IdentifierToken,
+    LiteralToken,
+    KeywordToken,
+    Token,
+)
 from cambridgeScript.syntax_tree.expression import Expression, Assignable
 from cambridgeScript.syntax_tree.types import Type
 
@@ -40,7 +46,7 @@ class Statement(ABC):
         pass
 
 
-@dataclass
+@dataclass(frozen=True)
 class ProcedureDecl(Statement):
     name: IdentifierToken
     params: list[tuple[IdentifierToken, "Type"]] | None
@@ -50,7 +56,7 @@ class ProcedureDecl(Statement):
         return visitor.visit_proc_decl(self)
 
 
-@dataclass
+@dataclass(frozen=True)
 class FunctionDecl(Statement):
     name: IdentifierToken
     params: list[tuple[IdentifierToken, Type]] | None
@@ -61,7 +67,7 @@ class FunctionDecl(Statement):
         return visitor.visit_func_decl(self)
 
 
-@dataclass
+@dataclass(frozen=True)
 class IfStmt(Statement):
     condition: Expression
     then_branch: list[Statement]
@@ -71,7 +77,7 @@ class IfStmt(Statement):
         return visitor.visit_if(self)
 
 
-@dataclass
+@dataclass(frozen=True)
 class CaseStmt(Statement):
     expr: Expression
     cases: list[tuple[IdentifierToken | LiteralToken, list[Statement]]]
@@ -81,7 +87,7 @@ class CaseStmt(Statement):
         return visitor.visit_case(self)
 
 
-@dataclass
+@dataclass(frozen=True)
 class ForStmt(Statement):
     variable: Assignable
     start: Expression
@@ -93,7 +99,7 @@ class ForStmt(Statement):
         return visitor.visit_for_loop(self)
 
 
-@dataclass
+@dataclass(frozen=True)
 class RepeatUntilStmt(Statement):
     body: list[Statement]
     condition: Expression
@@ -102,7 +108,7 @@ class RepeatUntilStmt(Statement):
         return visitor.visit_repeat_until(self)
 
 
-@dataclass
+@dataclass(frozen=True)
 class WhileStmt(Statement):
     condition: Expression
     body: list[Statement]
@@ -111,7 +117,7 @@ class WhileStmt(Statement):
         return visitor.visit_while(self)
 
 
-@dataclass
+@dataclass(frozen=True)
 class VariableDecl(Statement):
     # names: list[IdentifierToken]
     name: IdentifierToken
@@ -121,7 +127,7 @@ class VariableDecl(Statement):
         return visitor.visit_variable_decl(self)
 
 
-@dataclass
+@dataclass(frozen=True)
 class ConstantDecl(Statement):
     name: IdentifierToken
     value: LiteralToken
@@ -130,7 +136,7 @@ class ConstantDecl(Statement):
         return visitor.visit_constant_decl(self)
 
 
-@dataclass
+@dataclass(frozen=True)
 class InputStmt(Statement):
     variable: Assignable
 
@@ -138,7 +144,7 @@ class InputStmt(Statement):
         return visitor.visit_input(self)
 
 
-@dataclass
+@dataclass(frozen=True)
 class OutputStmt(Statement):
     values: list[Expression]
 
@@ -146,7 +152,7 @@ class OutputStmt(Statement):
         return visitor.visit_output(self)
 
 
-@dataclass
+@dataclass(frozen=True)
 class ReturnStmt(Statement):
     value: Expression
 
@@ -154,7 +160,7 @@ class ReturnStmt(Statement):
         return visitor.visit_return(self)
 
 
-@dataclass
+@dataclass(frozen=True)
 class FileOpenStmt(Statement):
     file: LiteralToken
     mode: KeywordToken
@@ -163,7 +169,7 @@ class FileOpenStmt(Statement):
         return visitor.visit_f_open(self)
 
 
-@dataclass
+@dataclass(frozen=True)
 class FileReadStmt(Statement):
     file: LiteralToken
     target: Assignable
@@ -172,7 +178,7 @@ class FileReadStmt(Statement):
         return visitor.visit_f_read(self)
 
 
-@dataclass
+@dataclass(frozen=True)
 class FileWriteStmt(Statement):
     file: LiteralToken
     value: Expression
@@ -181,7 +187,7 @@ class FileWriteStmt(Statement):
         return visitor.visit_f_write(self)
 
 
-@dataclass
+@dataclass(frozen=True)
 class FileCloseStmt(Statement):
     file: LiteralToken
 
@@ -189,7 +195,7 @@ class FileCloseStmt(Statement):
         return visitor.visit_f_close(self)
 
 
-@dataclass
+@dataclass(frozen=True)
 class ProcedureCallStmt(Statement):
     name: IdentifierToken
     args: list[Expression] | None
@@ -198,7 +204,7 @@ class ProcedureCallStmt(Statement):
         return visitor.visit_proc_call(self)
 
 
-@dataclass
+@dataclass(frozen=True)
 class AssignmentStmt(Statement):
     target: Assignable
     value: Expression
@@ -207,7 +213,7 @@ class AssignmentStmt(Statement):
         return visitor.visit_assign(self)
 
 
-@dataclass
+@dataclass(frozen=True)
 class ExprStmt(Statement):
     expr: Expression
 
@@ -215,9 +221,32 @@ class ExprStmt(Statement):
         return visitor.visit_expr_stmt(self)
 
 
-@dataclass
+@dataclass(frozen=True)
 class Program(Statement):
     statements: list[Statement]
 
     def accept(self, visitor: "StatementVisitor") -> Any:
         return visitor.visit_program(self)
+
+
+def first_line(node: Any) -> int | None:
+    """
+    Finds the line a statement or expression starts on
+    :param node: node, or list of nodes, to search
+    :return: the line of the first token in it, or None if it has none
+    """
+    if isinstance(node, Token):
+        return node.line
+    if isinstance(node, RepeatUntilStmt):
+        # The body comes first, but UNTIL is what runs every iteration
+        return first_line(node.condition)
+    if isinstance(node, (list, tuple)):
+        items = node
+    elif isinstance(node, (Expression, Statement)):
+        items = [getattr(node, field.name) for field in fields(node)]
+    else:
+        return None
+    for item in items:
+        if (line := first_line(item)) is not None:
+            return line
+    return None
@@ -0,0 +1,3 @@
+from .bytecode import *
+from .compiler import *
+from .machine import *
@@ -0,0 +1,159 @@
+__all__ = [
+    "Op",
+    "Code",
+]
+
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Any
+
+from cambridgeScript.syntax_tree.types import Type
+
+
+class Op(IntEnum):
+    """
+    Instructions of the VM.
+
+    Every instruction is an (opcode, argument) pair. The argument is a slot, a
+    jump target or a value, or a tuple of operands (a "site") for instructions
+    that need several, and 0 if unused. Instructions are grouped by how often
+    they run, which is the order the VM tests for them in.
+    """
+
+    # Expressions
+
+    # Push a variable (arg: slot)
+    LOAD_GLOBAL = 0
+    LOAD_LOCAL = 1
+    # Push arg
+    CONST = 2
+    # Binary operators with their left operand on the stack. BINARY pops
+    # the right operand too, the others take it from a constant or a
+    # variable (arg: (operator, constant or slot, left, right) site, the
+    # nodes are for errors)
+    BINARY = 3
+    BINARY_CONST = 4
+    BINARY_LOCAL = 5
+    BINARY_GLOBAL = 6
+    # Push an element of a one-dimensional array indexed by a variable plus
+    # a constant offset (arg: (is_local, slot, name, index_local, index_slot,
+    # index_name, offset, index) site, index is the node of the index)
+    LOAD_ELEMENT = 7
+    # Push the array, raising if the variable isn't an array (arg:
+    # (is_local, slot, name, count) site)
+    LOAD_ARRAY = 8
+    # Pop the indices and the array, push the element (arg: as LOAD_ARRAY)
+    INDEX = 9
+    # arg: the operator
+    UNARY = 10
+
+    # Statements
+
+    STORE_GLOBAL = 11
+    STORE_LOCAL = 12
+    # Raise if the assignment target isn't declared (arg: slot)
+    CHECK_GLOBAL = 13
+    CHECK_LOCAL = 14
+    # Loops count each iteration and their body's statements against the
+    # budget when the iteration starts, other blocks use TICK
+    # FOR keeps [current, end, step] on the stack. Both take a (body, exit,
+    # is_local, slot, cost) site. FOR_ITER declares the variable and counts
+    # the first iteration, or jumps to exit if there is none. FOR_STEP
+    # advances, then does the same for the next iteration, jumping back to
+    # body if there is one.
+    FOR_ITER = 15
+    FOR_STEP = 16
+    # Count arg statements against the budget, at the start of a block
+    TICK = 17
+    # Like BINARY and its variants, but jump to target if the result is false
+    # instead of pushing it (arg: (target, operator, constant or slot, left,
+    # right) site)
+    BRANCH = 18
+    BRANCH_CONST = 19
+    BRANCH_LOCAL = 20
+    BRANCH_GLOBAL = 21
+    # Jumps (arg: target)
+    JUMP = 22
+    JUMP_IF_FALSE = 23
+    # Pop the value, store it as in LOAD_ELEMENT
+    STORE_ELEMENT = 24
+    # Type check the value on top of the stack against the element type
+    # (arg: as LOAD_ARRAY)
+    CHECK_ELEMENT = 25
+    # Pop the indices and the value, store the value in the array (arg: as
+    # LOAD_ARRAY)
+    STORE_INDEX = 26
+
+    # Everything else
+
+    # Push the callee named arg, raising if it isn't defined
+    LOAD_FUNCTION = 27
+    LOAD_PROCEDURE = 28
+    # Call with arg arguments
+    CALL = 29
+    RETURN = 30
+    # End of a subroutine body without RETURN
+    END_PROCEDURE = 31
+    END_FUNCTION = 32
+    # REPEAT: pop the condition, and while it's false count the next
+    # iteration and jump back (arg: (start, cost) site). A TICK before the
+    # loop counts the first iteration.
+    REPEAT_UNTIL = 33
+    # Jump to arg[0][value], or to the default arg[1]
+    SWITCH = 34
+    # Compare arm with CASE value, jump to arg if they're different
+    CASE_NEXT = 35
+    POP = 36
+    # arg: number of values
+    OUTPUT = 37
+    # arg: (is_local, slot, name, is_array, file) site, file is None for
+    # INPUT and the name of the file for READFILE
+    INPUT = 38
+    # Declarations
+    # arg: (is_local, slot, type) site, and the number of ranges for arrays
+    DECLARE = 39
+    DECLARE_ARRAY = 40
+    # arg: (name, value)
+    DECLARE_CONSTANT = 41
+    # arg: Code of the subroutine
+    DECLARE_PROCEDURE = 42
+    DECLARE_FUNCTION = 43
+    # Files
+    # arg: (name, mode)
+    FILE_OPEN = 44
+    # Pop the value and write it (arg: name)
+    FILE_WRITE = 45
+    # arg: name
+    FILE_CLOSE = 46
+    HALT = 47
+
+
+@dataclass
+class Code:
+    """
+    Compiled body of a program or subroutine.
+
+    `instructions` holds (opcode, argument) pairs, and `lines[i]` is the
+    source line of `instructions[i]`.
+    """
+
+    name: str
+    instructions: list[tuple[int, Any]] = field(default_factory=list)
+    lines: list[int] = field(default_factory=list)
+    # Number of slots in the frame
+    size: int = 0
+    # Whether RETURN hands a value back to the caller
+    is_function: bool = False
+    # Slot and declared type of each parameter
+    params: tuple[tuple[int, Type], ...] = ()
+    # Slot -> variable name, for error messages
+    names: tuple[str, ...] = ()
+
+    def disassemble(self) -> str:
+        """Return a readable listing of the instructions."""
+        lines = []
+        for i, (op, arg) in enumerate(self.instructions):
+            if isinstance(arg, Code):
+                arg = f"<code {arg.name}>"
+            lines.append(f"{i:>5} {self.lines[i]:>4} {Op(op).name:<18} {arg}")
+        return "\n".join(lines)
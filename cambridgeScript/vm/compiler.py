@@ -0,0 +1,422 @@
+__all__ = [
+    "BytecodeCompiler",
+]
+
+from typing import Any
+
+from cambridgeScript.constants import Operator
+from cambridgeScript.exceptions import InvalidNode
+from cambridgeScript.interpreter.resolver import Resolution, Resolver, Scope
+from cambridgeScript.parser.lexer import LiteralToken
+from cambridgeScript.syntax_tree import (
+    Expression,
+    Identifier,
+    Literal,
+    ArrayIndex,
+    Assignable,
+    FunctionCall,
+    UnaryOp,
+    BinaryOp,
+    Statement,
+    AssignmentStmt,
+    ProcedureCallStmt,
+    FileCloseStmt,
+    FileWriteStmt,
+    FileReadStmt,
+    FileOpenStmt,
+    ReturnStmt,
+    OutputStmt,
+    InputStmt,
+    ConstantDecl,
+    VariableDecl,
+    WhileStmt,
+    first_line,
+    RepeatUntilStmt,
+    ForStmt,
+    CaseStmt,
+    IfStmt,
+    FunctionDecl,
+    ProcedureDecl,
+    Program,
+)
+from cambridgeScript.syntax_tree.types import ArrayType
+from cambridgeScript.syntax_tree.visitors import ExpressionVisitor, StatementVisitor
+from cambridgeScript.vm.bytecode import Code, Op
+
+
+# Offsets of the variants of BINARY and BRANCH, by where the right operand is
+_CONST = Op.BINARY_CONST - Op.BINARY
+_LOCAL = Op.BINARY_LOCAL - Op.BINARY
+_GLOBAL = Op.BINARY_GLOBAL - Op.BINARY
+
+
+def _names(scope: Scope) -> tuple[str, ...]:
+    names = [""] * scope.size
+    for name, slot in scope.names.items():
+        names[slot] = name
+    return tuple(names)
+
+
+class BytecodeCompiler(ExpressionVisitor, StatementVisitor):
+    """
+    Lowers a syntax tree into Code for the VM.
+
+    Expressions leave their value on the VM's stack and statements leave the
+    stack as they found it. Every subroutine is compiled into its own Code,
+    which is the argument of the instruction that declares it.
+    """
+
+    origin: list[str]
+    resolution: Resolution
+    code: Code
+
+    def __init__(self, origin: str = ""):
+        self.origin = origin.splitlines()
+        self.resolution = Resolution()
+        self.code = Code("<program>")
+        # Line of the last node with a token, for instructions without one
+        self._line = 0
+
+    @classmethod
+    def compile_program(cls, program: Program, origin: str = "") -> Code:
+        """
+        Compiles a program to bytecode
+        :param program: program to compile
+        :param origin: source code of the program, for error messages
+        :return: Code of the program's top level
+        """
+        compiler = cls(origin)
+        compiler.visit(program)
+        return compiler.code
+
+    def visit(self, thing: Expression | Statement) -> None:
+        if isinstance(thing, Expression):
+            ExpressionVisitor.visit(self, thing)
+        else:
+            StatementVisitor.visit(self, thing)
+
+    def visit_statements(self, statements: list[Statement]) -> None:
+        if statements:
+            self._emit(Op.TICK, len(statements), first_line(statements))
+        for stmt in statements:
+            self.visit(stmt)
+
+    def _loop_body(self, statements: list[Statement]) -> None:
+        # Loops count their body's statements along with each iteration
+        for stmt in statements:
+            self.visit(stmt)
+
+    # Helpers
+
+    def _emit(self, op: Op, arg: Any = 0, line: int | None = None) -> int:
+        # Append an instruction and return its position
+        if line is not None:
+            self._line = line
+        self.code.instructions.append((op.value, arg))
+        self.code.lines.append(self._line)
+        return len(self.code.instructions) - 1
+
+    def _here(self) -> int:
+        return len(self.code.instructions)
+
+    def _patch(self, position: int, target: int | None = None) -> None:
+        # Point the jump at `position` to target, or to the next instruction
+        if target is None:
+            target = self._here()
+        op, arg = self.code.instructions[position]
+        if isinstance(arg, tuple):
+            # Branches keep their target first in their site
+            arg = (target, *arg[1:])
+        else:
+            arg = target
+        self.code.instructions[position] = (op, arg)
+
+    def _slot(self, node: Identifier | VariableDecl) -> tuple[bool, int]:
+        return self.resolution.slots[id(node)]
+
+    def _right(self, expr: Expression, op: Op) -> tuple[Op, Any]:
+        # Variant of BINARY or BRANCH for the right operand expr, and its
+        # constant or slot. Other operands are compiled onto the stack.
+        if isinstance(expr, Literal) and isinstance(expr.token, LiteralToken):
+            return Op(op + _CONST), expr.token.value
+        if isinstance(expr, Identifier):
+            is_local, slot = self._slot(expr)
+            return Op(op + (_LOCAL if is_local else _GLOBAL)), slot
+        self.visit(expr)
+        return op, None
+
+    def _jump_if_false(self, condition: Expression) -> int:
+        # Emit a jump to be patched, taken if condition is false
+        if isinstance(condition, BinaryOp):
+            self.visit(condition.left)
+            op, operand = self._right(condition.right, Op.BRANCH)
+            site = (0, condition.operator, operand, condition.left, condition.right)
+            return self._emit(op, site)
+        self.visit(condition)
+        return self._emit(Op.JUMP_IF_FALSE)
+
+    def _array_site(self, target: ArrayIndex) -> tuple:
+        is_local, slot = self._slot(target.array)
+        return is_local, slot, target.array.token.value, len(target.index)
+
+    def _element_site(self, target: ArrayIndex) -> tuple | None:
+        # Site for LOAD_ELEMENT and STORE_ELEMENT, if the index is a variable,
+        # or a variable plus or minus an integer
+        offset = 0
+        match target.index:
+            case [Identifier() as index]:
+                variable = index
+            case [
+                BinaryOp(
+                    operator=Operator.ADD | Operator.SUB,
+                    left=Identifier() as variable,
+                    right=Literal(token=LiteralToken(value=int(offset))),
+                ) as index
+            ] if offset.__class__ is int:
+                if index.operator is Operator.SUB:
+                    offset = -offset
+            case _:
+                return None
+        is_local, slot = self._slot(target.array)
+        index_local, index_slot = self._slot(variable)
+        return (
+            is_local,
+            slot,
+            target.array.token.value,
+            index_local,
+            index_slot,
+            variable.token.value,
+            offset,
+            index,
+        )
+
+    def _subroutine(self, stmt: ProcedureDecl | FunctionDecl) -> Code:
+        enclosing = self.code
+        scope = self.resolution.scopes[id(stmt)]
+        self.code = Code(
+            stmt.name.value,
+            size=scope.size,
+            is_function=isinstance(stmt, FunctionDecl),
+            params=tuple(
+                (slot, type_)
+                for slot, (_, type_) in zip(
+                    self.resolution.params[id(stmt)], stmt.params or ()
+                )
+            ),
+            names=_names(scope),
+        )
+        self.visit_statements(stmt.body)
+        self._emit(Op.END_FUNCTION if self.code.is_function else Op.END_PROCEDURE)
+        code, self.code = self.code, enclosing
+        return code
+
+    # Expressions
+
+    def visit_binary_op(self, expr: BinaryOp) -> None:
+        self.visit(expr.left)
+        op, operand = self._right(expr.right, Op.BINARY)
+        self._emit(op, (expr.operator, operand, expr.left, expr.right))
+
+    def visit_unary_op(self, expr: UnaryOp) -> None:
+        self.visit(expr.operand)
+        self._emit(Op.UNARY, expr.operator)
+
+    def visit_function_call(self, expr: FunctionCall) -> None:
+        token = expr.function.token
+        self._emit(Op.LOAD_FUNCTION, token.value, token.line)
+        for param in expr.params:
+            self.visit(param)
+        self._emit(Op.CALL, len(expr.params), token.line)
+
+    def visit_array_index(self, expr: ArrayIndex) -> None:
+        line = expr.array.token.line
+        if (site := self._element_site(expr)) is not None:
+            self._emit(Op.LOAD_ELEMENT, site, line)
+            return
+        site = self._array_site(expr)
+        self._emit(Op.LOAD_ARRAY, site, line)
+        for index in expr.index:
+            self.visit(index)
+        self._emit(Op.INDEX, site, line)
+
+    def visit_literal(self, expr: Literal) -> None:
+        if not isinstance(expr.token, LiteralToken):
+            raise InvalidNode(expr, expr.token, self.origin)
+        self._emit(Op.CONST, expr.token.value, expr.token.line)
+
+    def visit_identifier(self, expr: Identifier) -> None:
+        is_local, slot = self._slot(expr)
+        self._emit(Op.LOAD_LOCAL if is_local else Op.LOAD_GLOBAL, slot, expr.token.line)
+
+    # Statements
+
+    def visit_proc_decl(self, stmt: ProcedureDecl) -> None:
+        self._emit(Op.DECLARE_PROCEDURE, self._subroutine(stmt))
+
+    def visit_func_decl(self, stmt: FunctionDecl) -> None:
+        self._emit(Op.DECLARE_FUNCTION, self._subroutine(stmt))
+
+    def visit_if(self, stmt: IfStmt) -> None:
+        skip_then = self._jump_if_false(stmt.condition)
+        self.visit_statements(stmt.then_branch)
+        if stmt.else_branch is None:
+            self._patch(skip_then)
+            return
+        skip_else = self._emit(Op.JUMP)
+        self._patch(skip_then)
+        self.visit_statements(stmt.else_branch)
+        self._patch(skip_else)
+
+    def visit_case(self, stmt: CaseStmt) -> None:
+        self.visit(stmt.expr)
+        ends = []
+        if all(isinstance(case, Literal) for case, _ in stmt.cases):
+            # Literal arms are looked up directly, the first arm wins if
+            # several have the same value
+            table: dict[Any, int] = {}
+            switch = self._emit(Op.SWITCH)
+            for case, body in stmt.cases:
+                table.setdefault(case.token.value, self._here())
+                self.visit_statements(body)
+                ends.append(self._emit(Op.JUMP))
+            self.code.instructions[switch] = (Op.SWITCH.value, (table, self._here()))
+            self.visit_statements(stmt.otherwise or [])
+        else:
+            for case, body in stmt.cases:
+                self.visit(case)
+                next_case = self._emit(Op.CASE_NEXT)
+                self._emit(Op.POP)
+                self.visit_statements(body)
+                ends.append(self._emit(Op.JUMP))
+                self._patch(next_case)
+            self._emit(Op.POP)
+            self.visit_statements(stmt.otherwise or [])
+        for end in ends:
+            self._patch(end)
+
+    def visit_for_loop(self, stmt: ForStmt) -> None:
+        line = first_line(stmt)
+        is_local, slot = self._slot(stmt.variable)
+        self.visit(stmt.start)
+        self.visit(stmt.end)
+        if stmt.step is not None:
+            self.visit(stmt.step)
+        else:
+            self._emit(Op.CONST, 1)
+        start = self._emit(Op.FOR_ITER, 0, line)
+        self._loop_body(stmt.body)
+        step = self._emit(Op.FOR_STEP, 0, line)
+        site = (start + 1, self._here(), is_local, slot, len(stmt.body) + 1)
+        self.code.instructions[start] = (Op.FOR_ITER.value, site)
+        self.code.instructions[step] = (Op.FOR_STEP.value, site)
+
+    def visit_repeat_until(self, stmt: RepeatUntilStmt) -> None:
+        line = first_line(stmt)
+        cost = len(stmt.body) + 1
+        self._emit(Op.TICK, cost, line)
+        start = self._here()
+        self._loop_body(stmt.body)
+        self.visit(stmt.condition)
+        self._emit(Op.REPEAT_UNTIL, (start, cost), line)
+
+    def visit_while(self, stmt: WhileStmt) -> None:
+        line = first_line(stmt)
+        start = self._here()
+        exit_ = self._jump_if_false(stmt.condition)
+        self._emit(Op.TICK, len(stmt.body) + 1, line)
+        self._loop_body(stmt.body)
+        self._emit(Op.JUMP, start, line)
+        self._patch(exit_)
+
+    def visit_variable_decl(self, stmt: VariableDecl) -> None:
+        is_local, slot = self._slot(stmt)
+        line = stmt.name.line
+        if not isinstance(stmt.vartype, ArrayType):
+            self._emit(Op.DECLARE, (is_local, slot, stmt.vartype), line)
+            return
+        for a, b in stmt.vartype.ranges:
+            self.visit(a)
+            self.visit(b)
+        site = (is_local, slot, stmt.vartype, len(stmt.vartype.ranges))
+        self._emit(Op.DECLARE_ARRAY, site, line)
+
+    def visit_constant_decl(self, stmt: ConstantDecl) -> None:
+        site = (stmt.name.value, stmt.value.value)
+        self._emit(Op.DECLARE_CONSTANT, site, stmt.name.line)
+
+    def visit_input(self, stmt: InputStmt) -> None:
+        self._input(stmt.variable, None)
+
+    def _input(self, variable: Assignable, file: str | None) -> None:
+        # INPUT, or READFILE from file
+        is_array = isinstance(variable, ArrayIndex)
+        identifier = variable.array if is_array else variable
+        line = identifier.token.line
+        is_local, slot = self._slot(identifier)
+        name = identifier.token.value
+        self._emit(Op.INPUT, (is_local, slot, name, is_array, file), line)
+        if is_array:
+            # INPUT leaves the value for the array element on the stack
+            for index in variable.index:
+                self.visit(index)
+            self._emit(Op.STORE_INDEX, self._array_site(variable), line)
+
+    def visit_output(self, stmt: OutputStmt) -> None:
+        for value in stmt.values:
+            self.visit(value)
+        self._emit(Op.OUTPUT, len(stmt.values))
+
+    def visit_return(self, stmt: ReturnStmt) -> None:
+        self.visit(stmt.value)
+        self._emit(Op.RETURN)
+
+    def visit_f_open(self, stmt: FileOpenStmt) -> None:
+        site = (stmt.file.value, stmt.mode.kind)
+        self._emit(Op.FILE_OPEN, site, stmt.file.line)
+
+    def visit_f_read(self, stmt: FileReadStmt) -> None:
+        self._input(stmt.target, stmt.file.value)
+
+    def visit_f_write(self, stmt: FileWriteStmt) -> None:
+        self.visit(stmt.value)
+        self._emit(Op.FILE_WRITE, stmt.file.value, stmt.file.line)
+
+    def visit_f_close(self, stmt: FileCloseStmt) -> None:
+        self._emit(Op.FILE_CLOSE, stmt.file.value, stmt.file.line)
+
+    def visit_proc_call(self, stmt: ProcedureCallStmt) -> None:
+        line = stmt.name.line
+        self._emit(Op.LOAD_PROCEDURE, stmt.name.value, line)
+        for arg in stmt.args or ():
+            self.visit(arg)
+        self._emit(Op.CALL, len(stmt.args or ()), line)
+
+    def visit_assign(self, stmt: AssignmentStmt) -> None:
+        if isinstance(stmt.target, ArrayIndex):
+            line = stmt.target.array.token.line
+            self.visit(stmt.value)
+            if (site := self._element_site(stmt.target)) is not None:
+                self._emit(Op.STORE_ELEMENT, site, line)
+                return
+            site = self._array_site(stmt.target)
+            self._emit(Op.CHECK_ELEMENT, site, line)
+            for index in stmt.target.index:
+                self.visit(index)
+            self._emit(Op.STORE_INDEX, site, line)
+            return
+
+        line = stmt.target.token.line
+        is_local, slot = self._slot(stmt.target)
+        if not isinstance(stmt.value, Literal):
+            # The target is checked before the value is evaluated, a literal
+            # can't fail or have side effects so STORE's own check is enough
+            self._emit(Op.CHECK_LOCAL if is_local else Op.CHECK_GLOBAL, slot, line)
+        self.visit(stmt.value)
+        self._emit(Op.STORE_LOCAL if is_local else Op.STORE_GLOBAL, slot, line)
+
+    def visit_program(self, stmt: Program) -> None:
+        self.resolution = Resolver.resolve(stmt)
+        self.code.size = self.resolution.globals.size
+        self.code.names = _names(self.resolution.globals)
+        self.visit_statements(stmt.statements)
+        self._emit(Op.HALT)
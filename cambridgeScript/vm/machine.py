@@ -0,0 +1,643 @@
+__all__ = [
+    "VM",
+]
+
+from cambridgeScript.exceptions import (
+    InterpreterError,
+    PseudoAssignmentError,
+    PseudoIndexError,
+    PseudoSubroutineError,
+    PseudoUndefinedError,
+    PseudoOpError,
+    PseudoInputError,
+)
+from cambridgeScript.interpreter.input import parse_value
+from cambridgeScript.interpreter.interpreter import Interpreter
+from cambridgeScript.interpreter.variables import Array
+from cambridgeScript.syntax_tree.types import PrimitiveType, ArrayType
+from cambridgeScript.vm.bytecode import Code, Op
+
+# Plain ints compare faster than enum members in the dispatch loop
+_LOAD_GLOBAL = Op.LOAD_GLOBAL.value
+_LOAD_LOCAL = Op.LOAD_LOCAL.value
+_CONST = Op.CONST.value
+_BINARY = Op.BINARY.value
+_BINARY_CONST = Op.BINARY_CONST.value
+_BINARY_LOCAL = Op.BINARY_LOCAL.value
+_BINARY_GLOBAL = Op.BINARY_GLOBAL.value
+_LOAD_ELEMENT = Op.LOAD_ELEMENT.value
+_LOAD_ARRAY = Op.LOAD_ARRAY.value
+_INDEX = Op.INDEX.value
+_UNARY = Op.UNARY.value
+_STORE_GLOBAL = Op.STORE_GLOBAL.value
+_STORE_LOCAL = Op.STORE_LOCAL.value
+_CHECK_GLOBAL = Op.CHECK_GLOBAL.value
+_CHECK_LOCAL = Op.CHECK_LOCAL.value
+_FOR_ITER = Op.FOR_ITER.value
+_FOR_STEP = Op.FOR_STEP.value
+_TICK = Op.TICK.value
+_BRANCH = Op.BRANCH.value
+_BRANCH_CONST = Op.BRANCH_CONST.value
+_BRANCH_LOCAL = Op.BRANCH_LOCAL.value
+_BRANCH_GLOBAL = Op.BRANCH_GLOBAL.value
+_JUMP = Op.JUMP.value
+_JUMP_IF_FALSE = Op.JUMP_IF_FALSE.value
+_STORE_ELEMENT = Op.STORE_ELEMENT.value
+_CHECK_ELEMENT = Op.CHECK_ELEMENT.value
+_STORE_INDEX = Op.STORE_INDEX.value
+_LOAD_FUNCTION = Op.LOAD_FUNCTION.value
+_LOAD_PROCEDURE = Op.LOAD_PROCEDURE.value
+_CALL = Op.CALL.value
+_RETURN = Op.RETURN.value
+_END_PROCEDURE = Op.END_PROCEDURE.value
+_END_FUNCTION = Op.END_FUNCTION.value
+_REPEAT_UNTIL = Op.REPEAT_UNTIL.value
+_SWITCH = Op.SWITCH.value
+_CASE_NEXT = Op.CASE_NEXT.value
+_POP = Op.POP.value
+_OUTPUT = Op.OUTPUT.value
+_INPUT = Op.INPUT.value
+_DECLARE = Op.DECLARE.value
+_DECLARE_ARRAY = Op.DECLARE_ARRAY.value
+_DECLARE_CONSTANT = Op.DECLARE_CONSTANT.value
+_DECLARE_PROCEDURE = Op.DECLARE_PROCEDURE.value
+_DECLARE_FUNCTION = Op.DECLARE_FUNCTION.value
+_FILE_OPEN = Op.FILE_OPEN.value
+_FILE_WRITE = Op.FILE_WRITE.value
+_FILE_CLOSE = Op.FILE_CLOSE.value
+_HALT = Op.HALT.value
+
+DEFAULT_MAX_DEPTH = 100_000
+
+
+class VM:
+    """
+    Runs Code from the BytecodeCompiler in a single dispatch loop.
+
+    Like the Compiler, the VM runs against the state of an interpreter
+    (global variables, constants, builtins and streams) and behaves exactly
+    like it. Subroutine calls push a record onto the VM's own call stack
+    instead of recursing in Python, and each call's locals are plain lists, so
+    the depth of recursion is only limited by max_depth. Each active call
+    costs one record plus two lists with one entry per local variable.
+    """
+
+    interpreter: Interpreter
+    functions: dict[str, Code]
+    procedures: dict[str, Code]
+    max_depth: int
+
+    def __init__(self, interpreter: Interpreter, max_depth: int = DEFAULT_MAX_DEPTH):
+        """
+        :param interpreter: interpreter whose state the program runs against
+        :param max_depth: maximum number of subroutine calls active at once
+        """
+        self.interpreter = interpreter
+        self.functions = {}
+        self.procedures = {}
+        self.max_depth = max_depth
+
+    def _unset(self, declared: bool, name: str, line: int):
+        # Value of a variable whose slot holds None
+        if declared:
+            raise InterpreterError(
+                f"Name {name} has no value", self.interpreter.origin, line
+            )
+        constants = self.interpreter.variable_state.constants
+        if name in constants:
+            return constants[name]
+        raise InterpreterError(
+            f"Name {name} isn't defined", self.interpreter.origin, line
+        )
+
+    def _undeclared(self, name: str, line: int, error=PseudoAssignmentError):
+        # Raise for a write to a variable that wasn't declared
+        origin = self.interpreter.origin
+        if name in self.interpreter.variable_state.constants:
+            if error is PseudoInputError:
+                raise error(
+                    f"{name} is a constant, which can't be inputted", origin, line
+                )
+            raise error(
+                f"{name} is a constant, which can't be assigned a value.", origin, line
+            )
+        raise InterpreterError(f"{name} was not declared", origin, line)
+
+    def _bad_store(self, vartype, name: str, line: int):
+        # Raise for a value that can't be stored in a variable
+        if vartype is None:
+            self._undeclared(name, line)
+        raise PseudoAssignmentError(
+            f"Type Error for assigning {name}, expected {vartype.name}",
+            self.interpreter.origin,
+            line,
+        )
+
+    def _not_array(self, name: str, line: int):
+        # Raise for indexing a variable that isn't an array
+        raise PseudoAssignmentError(
+            f"{name} is not an array.", self.interpreter.origin, line
+        )
+
+    def _bad_element(self, element_type, name: str, line: int):
+        # Raise for a value that can't be stored in an array
+        raise PseudoAssignmentError(
+            f"Trying to assign invalid type to array {name}, expected {element_type.name}",
+            self.interpreter.origin,
+            line,
+        )
+
+    @staticmethod
+    def _call_line(calls: list) -> int:
+        # Line of the innermost active call, from the caller's code and pc
+        code, pc = calls[-1][:2]
+        return code.lines[pc - 1]
+
+    def run(self, code: Code) -> None:
+        """
+        Runs the Code of a program
+        :param code: Code returned by BytecodeCompiler.compile_program
+        """
+        self.interpreter.budget.start()
+        try:
+            self._run(code)
+        finally:
+            self.interpreter.finish()
+
+    def _run(self, code: Code) -> None:
+        interpreter = self.interpreter
+        state = interpreter.variable_state
+        origin = interpreter.origin
+        builtins = interpreter.builtins
+        check_type = interpreter.check_type
+        read_line = interpreter.input.read_line
+        files = interpreter.files
+        write_line = interpreter.output.write_line
+        functions = self.functions
+        procedures = self.procedures
+        max_depth = self.max_depth
+        budget = interpreter.budget
+        integer = PrimitiveType.INTEGER
+        # The budget's counter, kept in a local while the loop runs
+        remaining = budget.remaining
+
+        state.globals.allocate(code.size)
+        gvalues = state.globals.values
+        gtypes = state.globals.types
+        gnames = code.names
+
+        # State of the running Code. Lines are only looked up to raise, as
+        # lines[pc - 1] for the instruction being run.
+        values = gvalues
+        types = gtypes
+        names = gnames
+        instructions = code.instructions
+        lines = code.lines
+        pc = 0
+
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        # (code, pc, values, types, stack base) of each active call
+        calls = []
+
+        # Each group of instructions is tested for in order of how often its
+        # instructions run, so common ones take few comparisons to find
+        while True:
+            op, arg = instructions[pc]
+            pc += 1
+
+            if op < _STORE_GLOBAL:
+                # Expressions
+                if op == _LOAD_GLOBAL:
+                    value = gvalues[arg]
+                    if value is None:
+                        value = self._unset(
+                            gtypes[arg] is not None, gnames[arg], lines[pc - 1]
+                        )
+                    push(value)
+                elif op == _LOAD_LOCAL:
+                    value = values[arg]
+                    if value is None:
+                        value = self._unset(
+                            types[arg] is not None, names[arg], lines[pc - 1]
+                        )
+                    push(value)
+                elif op == _BINARY_CONST:
+                    try:
+                        stack[-1] = arg[0](stack[-1], arg[1])
+                    except TypeError as e:
+                        raise PseudoOpError(arg[2], arg[3], e)
+                elif op == _BINARY_GLOBAL:
+                    right = gvalues[arg[1]]
+                    if right is None:
+                        right = self._unset(
+                            gtypes[arg[1]] is not None, gnames[arg[1]], lines[pc - 1]
+                        )
+                    try:
+                        stack[-1] = arg[0](stack[-1], right)
+                    except TypeError as e:
+                        raise PseudoOpError(arg[2], arg[3], e)
+                elif op == _BINARY_LOCAL:
+                    right = values[arg[1]]
+                    if right is None:
+                        right = self._unset(
+                            types[arg[1]] is not None, names[arg[1]], lines[pc - 1]
+                        )
+                    try:
+                        stack[-1] = arg[0](stack[-1], right)
+                    except TypeError as e:
+                        raise PseudoOpError(arg[2], arg[3], e)
+                elif op == _LOAD_ELEMENT:
+                    (
+                        is_local,
+                        slot,
+                        name,
+                        index_local,
+                        index_slot,
+                        index_name,
+                        offset,
+                        index_node,
+                    ) = arg
+                    if not isinstance((types if is_local else gtypes)[slot], ArrayType):
+                        self._not_array(name, lines[pc - 1])
+                    index = (values if index_local else gvalues)[index_slot]
+                    if index is None:
+                        index = self._unset(
+                            (types if index_local else gtypes)[index_slot] is not None,
+                            index_name,
+                            lines[pc - 1],
+                        )
+                    if offset:
+                        try:
+                            index += offset
+                        except TypeError as e:
+                            raise PseudoOpError(index_node.left, index_node.right, e)
+                    array = (values if is_local else gvalues)[slot]
+                    try:
+                        push(array.cells[array.offset((index,))])
+                    except IndexError:
+                        raise PseudoIndexError(
+                            name, [index], array.ranges, origin, lines[pc - 1]
+                        )
+                elif op == _CONST:
+                    push(arg)
+                elif op == _BINARY:
+                    right = pop()
+                    try:
+                        stack[-1] = arg[0](stack[-1], right)
+                    except TypeError as e:
+                        raise PseudoOpError(arg[2], arg[3], e)
+                elif op == _LOAD_ARRAY:
+                    is_local, slot, name, _ = arg
+                    if not isinstance((types if is_local else gtypes)[slot], ArrayType):
+                        self._not_array(name, lines[pc - 1])
+                    push((values if is_local else gvalues)[slot])
+                elif op == _INDEX:
+                    count = arg[3]
+                    indices = stack[-count:]
+                    del stack[-count:]
+                    array = stack[-1]
+                    try:
+                        stack[-1] = array.cells[array.offset(indices)]
+                    except IndexError:
+                        raise PseudoIndexError(
+                            arg[2], indices, array.ranges, origin, lines[pc - 1]
+                        )
+                else:
+                    # UNARY
+                    stack[-1] = arg(stack[-1])
+
+            elif op < _LOAD_FUNCTION:
+                # Statements
+                if op == _FOR_STEP:
+                    # Stack: [current, end, step]
+                    current = stack[-3] + stack[-1]
+                    if current <= stack[-2] if stack[-1] > 0 else current >= stack[-2]:
+                        stack[-3] = current
+                        body, _, is_local, slot, cost = arg
+                        if is_local:
+                            values[slot] = current
+                            types[slot] = integer
+                        else:
+                            gvalues[slot] = current
+                            gtypes[slot] = integer
+                        remaining -= cost
+                        if remaining < 0:
+                            budget.remaining = remaining
+                            budget.check(origin, lines[pc - 1])
+                            remaining = budget.remaining
+                        pc = body
+                    else:
+                        del stack[-3:]
+                elif op == _CHECK_GLOBAL:
+                    if gtypes[arg] is None:
+                        self._undeclared(gnames[arg], lines[pc - 1])
+                elif op == _STORE_GLOBAL:
+                    vartype = gtypes[arg]
+                    value = pop()
+                    # An Enum's value is a slow property, _value_ is the same
+                    # object stored as a plain attribute
+                    if vartype is None or not (
+                        (
+                            vartype.__class__ is PrimitiveType
+                            and value.__class__ is vartype._value_
+                        )
+                        or check_type(value, vartype)
+                    ):
+                        self._bad_store(vartype, gnames[arg], lines[pc - 1])
+                    gvalues[arg] = value
+                elif op == _BRANCH_CONST:
+                    try:
+                        if not arg[1](pop(), arg[2]):
+                            pc = arg[0]
+                    except TypeError as e:
+                        raise PseudoOpError(arg[3], arg[4], e)
+                elif op == _TICK:
+                    remaining -= arg
+                    if remaining < 0:
+                        budget.remaining = remaining
+                        budget.check(origin, lines[pc - 1])
+                        remaining = budget.remaining
+                elif op == _CHECK_LOCAL:
+                    if types[arg] is None:
+                        self._undeclared(names[arg], lines[pc - 1])
+                elif op == _STORE_LOCAL:
+                    vartype = types[arg]
+                    value = pop()
+                    if vartype is None or not (
+                        (
+                            vartype.__class__ is PrimitiveType
+                            and value.__class__ is vartype._value_
+                        )
+                        or check_type(value, vartype)
+                    ):
+                        self._bad_store(vartype, names[arg], lines[pc - 1])
+                    values[arg] = value
+                elif op == _BRANCH_LOCAL:
+                    right = values[arg[2]]
+                    if right is None:
+                        right = self._unset(
+                            types[arg[2]] is not None, names[arg[2]], lines[pc - 1]
+                        )
+                    try:
+                        if not arg[1](pop(), right):
+                            pc = arg[0]
+                    except TypeError as e:
+                        raise PseudoOpError(arg[3], arg[4], e)
+                elif op == _BRANCH_GLOBAL:
+                    right = gvalues[arg[2]]
+                    if right is None:
+                        right = self._unset(
+                            gtypes[arg[2]] is not None, gnames[arg[2]], lines[pc - 1]
+                        )
+                    try:
+                        if not arg[1](pop(), right):
+                            pc = arg[0]
+                    except TypeError as e:
+                        raise PseudoOpError(arg[3], arg[4], e)
+                elif op == _BRANCH:
+                    right = pop()
+                    try:
+                        if not arg[1](pop(), right):
+                            pc = arg[0]
+                    except TypeError as e:
+                        raise PseudoOpError(arg[3], arg[4], e)
+                elif op == _JUMP:
+                    pc = arg
+                elif op == _STORE_ELEMENT:
+                    (
+                        is_local,
+                        slot,
+                        name,
+                        index_local,
+                        index_slot,
+                        index_name,
+                        offset,
+                        index_node,
+                    ) = arg
+                    try:
+                        element_type = (types if is_local else gtypes)[slot].type
+                    except AttributeError:
+                        self._not_array(name, lines[pc - 1])
+                    value = pop()
+                    if not (
+                        value.__class__ is element_type._value_
+                        or check_type(value, element_type)
+                    ):
+                        self._bad_element(element_type, name, lines[pc - 1])
+                    index = (values if index_local else gvalues)[index_slot]
+                    if index is None:
+                        index = self._unset(
+                            (types if index_local else gtypes)[index_slot] is not None,
+                            index_name,
+                            lines[pc - 1],
+                        )
+                    if offset:
+                        try:
+                            index += offset
+                        except TypeError as e:
+                            raise PseudoOpError(index_node.left, index_node.right, e)
+                    array = (values if is_local else gvalues)[slot]
+                    try:
+                        array.cells[array.offset((index,))] = value
+                    except IndexError:
+                        raise PseudoIndexError(
+                            name, [index], array.ranges, origin, lines[pc - 1]
+                        )
+                elif op == _JUMP_IF_FALSE:
+                    if not pop():
+                        pc = arg
+                elif op == _FOR_ITER:
+                    current = stack[-3]
+                    if current <= stack[-2] if stack[-1] > 0 else current >= stack[-2]:
+                        _, _, is_local, slot, cost = arg
+                        if is_local:
+                            values[slot] = current
+                            types[slot] = integer
+                        else:
+                            gvalues[slot] = current
+                            gtypes[slot] = integer
+                        remaining -= cost
+                        if remaining < 0:
+                            budget.remaining = remaining
+                            budget.check(origin, lines[pc - 1])
+                            remaining = budget.remaining
+                    else:
+                        del stack[-3:]
+                        pc = arg[1]
+                elif op == _CHECK_ELEMENT:
+                    is_local, slot, name, _ = arg
+                    try:
+                        element_type = (types if is_local else gtypes)[slot].type
+                    except AttributeError:
+                        self._not_array(name, lines[pc - 1])
+                    value = stack[-1]
+                    if not (
+                        value.__class__ is element_type._value_
+                        or check_type(value, element_type)
+                    ):
+                        self._bad_element(element_type, name, lines[pc - 1])
+                else:
+                    # STORE_INDEX
+                    is_local, slot, name, count = arg
+                    indices = stack[-count:]
+                    del stack[-count:]
+                    value = pop()
+                    array = (values if is_local else gvalues)[slot]
+                    try:
+                        array.cells[array.offset(indices)] = value
+                    except IndexError:
+                        raise PseudoIndexError(
+                            name, indices, array.ranges, origin, lines[pc - 1]
+                        )
+
+            elif op == _CALL:
+                if arg:
+                    args = stack[-arg:]
+                    del stack[-arg:]
+                else:
+                    args = []
+                callee = pop()
+                if callee.__class__ is not Code:
+                    # Builtin function
+                    push(callee(args))
+                    continue
+                if len(calls) >= max_depth:
+                    raise PseudoSubroutineError(
+                        f"Maximum recursion depth ({max_depth}) exceeded",
+                        origin,
+                        lines[pc - 1],
+                    )
+                calls.append((code, pc, values, types, len(stack)))
+                code = callee
+                values = [None] * code.size
+                types = [None] * code.size
+                for (slot, param_type), value in zip(code.params, args):
+                    # Parameters are passed BYVAL, so arrays are copied
+                    if value.__class__ is Array:
+                        value = value.copy()
+                    values[slot] = value
+                    types[slot] = param_type
+                names = code.names
+                instructions = code.instructions
+                lines = code.lines
+                pc = 0
+            elif op == _LOAD_FUNCTION:
+                if arg in builtins:
+                    push(builtins[arg])
+                elif arg in functions:
+                    push(functions[arg])
+                else:
+                    raise PseudoUndefinedError(
+                        f"name {arg} is not defined", origin, lines[pc - 1]
+                    )
+            elif op == _RETURN or op == _END_PROCEDURE:
+                if not calls:
+                    # A RETURN outside of a function ends the program
+                    break
+                if op == _RETURN and not code.is_function:
+                    raise PseudoSubroutineError(
+                        f"Procedure {code.name} mustn't has return values",
+                        origin,
+                        self._call_line(calls),
+                    )
+                code, pc, values, types, base = calls.pop()
+                if op == _RETURN:
+                    value = pop()
+                    del stack[base:]
+                    push(value)
+                else:
+                    del stack[base:]
+                names = code.names
+                instructions = code.instructions
+                lines = code.lines
+            elif op == _LOAD_PROCEDURE:
+                if arg not in procedures:
+                    raise PseudoUndefinedError(
+                        f"Procedure {arg} is not defined", origin, lines[pc - 1]
+                    )
+                push(procedures[arg])
+            elif op == _REPEAT_UNTIL:
+                if not pop():
+                    start, cost = arg
+                    remaining -= cost
+                    if remaining < 0:
+                        budget.remaining = remaining
+                        budget.check(origin, lines[pc - 1])
+                        remaining = budget.remaining
+                    pc = start
+            elif op == _SWITCH:
+                table, default = arg
+                pc = table.get(pop(), default)
+            elif op == _CASE_NEXT:
+                if not pop() == stack[-1]:
+                    pc = arg
+            elif op == _POP:
+                pop()
+            elif op == _OUTPUT:
+                if arg:
+                    output = stack[-arg:]
+                    del stack[-arg:]
+                else:
+                    output = []
+                write_line("".join(map(str, output)))
+            elif op == _INPUT:
+                is_local, slot, name, is_array, file = arg
+                line = lines[pc - 1]
+                declared_type = (types if is_local else gtypes)[slot]
+                if declared_type is None:
+                    self._undeclared(name, line, PseudoInputError)
+                if is_array and not isinstance(declared_type, ArrayType):
+                    self._not_array(name, line)
+                vartype = declared_type.type if is_array else declared_type
+                if file is None:
+                    text = read_line()
+                else:
+                    text = files.read_line(file, line)
+                value = parse_value(vartype, text, name, origin, line)
+                if is_array:
+                    # Stored by the STORE_INDEX after the indices
+                    push(value)
+                else:
+                    (values if is_local else gvalues)[slot] = value
+            elif op == _DECLARE:
+                is_local, slot, vartype = arg
+                (values if is_local else gvalues)[slot] = None
+                (types if is_local else gtypes)[slot] = vartype
+            elif op == _DECLARE_ARRAY:
+                is_local, slot, vartype, count = arg
+                bounds = stack[-2 * count :]
+                del stack[-2 * count :]
+                ranges = list(zip(bounds[::2], bounds[1::2]))
+                budget.allocate(ranges, origin, lines[pc - 1])
+                (values if is_local else gvalues)[slot] = state.create_nd_array(
+                    ranges
+                )
+                (types if is_local else gtypes)[slot] = vartype
+            elif op == _DECLARE_CONSTANT:
+                name, value = arg
+                state.constants[name] = value
+            elif op == _DECLARE_PROCEDURE:
+                procedures[arg.name] = arg
+            elif op == _DECLARE_FUNCTION:
+                functions[arg.name] = arg
+            elif op == _FILE_OPEN:
+                name, mode = arg
+                files.open(name, mode, lines[pc - 1])
+            elif op == _FILE_WRITE:
+                files.write_line(arg, str(pop()), lines[pc - 1])
+            elif op == _FILE_CLOSE:
+                files.close(arg, lines[pc - 1])
+            elif op == _END_FUNCTION:
+                raise PseudoSubroutineError(
+                    f"Function {code.name} did not return a value",
+                    origin,
+                    self._call_line(calls),
+                )
+            elif op == _HALT:
+                break
+            else:
+                raise ValueError(f"Unknown opcode {op}")
+
+        budget.remaining = remaining
@@ -0,0 +1,14 @@
+CONSTANT Low <- -3
+DECLARE a : INTEGER
+a <- 2
+OUTPUT -a ^ 2
+OUTPUT -2 ^ 2
+OUTPUT (-2) ^ 2
+OUTPUT 2 ^ -1
+OUTPUT 2 ^ 3 ^ 2
+OUTPUT -7 MOD 3
+OUTPUT 7 MOD -3
+OUTPUT -7 DIV 2
+OUTPUT 7 DIV -2
+OUTPUT -a * 3 MOD 4
+OUTPUT Low - -a
@@ -0,0 +1,25 @@
+// Outputs 1256. With --max-statements, every engine stops on the same line,
+// e.g. line 23 (UNTIL) with --max-statements 500, and runs to the end with
+// --max-statements 1319
+DECLARE Total : INTEGER
+DECLARE Count : INTEGER
+PROCEDURE Bump(n : INTEGER)
+    Total <- Total + n
+ENDPROCEDURE
+Total <- 0
+FOR i <- 1 TO 20
+    Count <- 0
+    WHILE Count < i DO
+        Count <- Count + 1
+        IF Count MOD 3 = 0 THEN
+            CALL Bump(Count)
+        ELSE
+            Total <- Total + 1
+        ENDIF
+    ENDWHILE
+    REPEAT
+        Count <- Count - 2
+        Total <- Total + Count
+    UNTIL Count <= 0
+NEXT i
+OUTPUT Total
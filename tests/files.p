@@ -0,0 +1,33 @@
+// Writes scratch.tmp and reads it back. Run it with --virtual-files to keep the
+// file in memory, otherwise it is left in the working directory, as programs
+// can't delete files.
+DECLARE Line : STRING
+DECLARE Number : INTEGER
+DECLARE Total : INTEGER
+
+OPENFILE "scratch.tmp" FOR WRITE
+FOR i <- 1 TO 5
+    WRITEFILE "scratch.tmp", i * i
+NEXT i
+CLOSEFILE "scratch.tmp"
+
+Total <- 0
+OPENFILE "scratch.tmp" FOR READ
+WHILE NOT EOF("scratch.tmp") DO
+    READFILE "scratch.tmp", Number
+    OUTPUT Number
+    Total <- Total + Number
+ENDWHILE
+CLOSEFILE "scratch.tmp"
+OUTPUT "Total: ", Total
+
+OPENFILE "scratch.tmp" FOR WRITE
+WRITEFILE "scratch.tmp", "first"
+WRITEFILE "scratch.tmp", "second"
+CLOSEFILE "scratch.tmp"
+OPENFILE "scratch.tmp" FOR READ
+READFILE "scratch.tmp", Line
+OUTPUT Line, " ", EOF("scratch.tmp")
+READFILE "scratch.tmp", Line
+OUTPUT Line, " ", EOF("scratch.tmp")
+CLOSEFILE "scratch.tmp"
@@ -0,0 +1,13 @@
+DECLARE x : INTEGER
+DECLARE y : INTEGER
+FOR x <- -2 TO 2
+    CASE OF x
+        1 : y <- x
+        -1 : OUTPUT "minus one"
+        -2 : OUTPUT "minus two"
+        OTHERWISE : OUTPUT x -1
+    ENDCASE
+NEXT x
+y <- 10
+    - 4
+OUTPUT y
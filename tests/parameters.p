@@ -0,0 +1,24 @@
+DECLARE Numbers : ARRAY[1:3] OF INTEGER
+FOR i <- 1 TO 3
+    Numbers[i] <- i
+NEXT i
+
+PROCEDURE Change(Values : ARRAY[1:3] OF INTEGER)
+    Values[1] <- 99
+    OUTPUT Values[1]
+ENDPROCEDURE
+
+FUNCTION Total(Values : ARRAY[1:3] OF INTEGER) RETURNS INTEGER
+    DECLARE Sum : INTEGER
+    Sum <- 0
+    FOR i <- 1 TO 3
+        Sum <- Sum + Values[i]
+        Values[i] <- 0
+    NEXT i
+    RETURN Sum
+ENDFUNCTION
+
+CALL Change(Numbers)
+OUTPUT Numbers[1]
+OUTPUT Total(Numbers)
+OUTPUT Numbers[1], Numbers[2], Numbers[3]